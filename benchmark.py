@@ -0,0 +1,415 @@
+"""
+SafeGuard Content Filter - Benchmark Tool
+Drives the API endpoints with reproducible synthetic corpora (search queries,
+~5 KB pages, domains, and image fixtures served by a local stub HTTP server)
+at a fixed concurrency, and reports throughput and latency percentiles.
+Results can be saved as a JSON baseline and compared against a later run:
+
+    python benchmark.py run --concurrency 16 --requests 2000 --output baseline.json
+    python benchmark.py run --url https://127.0.0.1:8000 --insecure --baseline baseline.json
+    python benchmark.py compare baseline.json current.json
+
+Without --url the server is started in this process on a free local port
+"""
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import struct
+import argparse
+import platform
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from pattern_matcher import harmful_patterns, educational_terms
+
+ENDPOINTS = ("analyze_query", "analyze_content", "check_domain", "analyze_image")
+
+# Filler vocabulary for synthetic text
+COMMON_WORDS = [
+    "the", "a", "of", "and", "to", "in", "is", "for", "on", "with", "how", "best",
+    "recipe", "weather", "price", "review", "guide", "video", "music", "travel",
+    "city", "school", "game", "update", "online", "free", "news", "football",
+    "garden", "phone", "laptop", "movie", "book", "kitchen", "market", "report",
+    "local", "summer", "winter", "history", "photo", "story", "team", "family"
+]
+
+DOMAIN_WORDS = [
+    "news", "shop", "daily", "tech", "blog", "media", "cloud", "world", "home",
+    "food", "sports", "travel", "games", "health", "learn", "video", "photo"
+]
+DOMAIN_TLDS = ["com", "net", "org", "io", "co.uk", "de", "info"]
+
+# Share of generated items that carry harmful and educational terms
+HARMFUL_SHARE = 0.3
+EDUCATIONAL_SHARE = 0.2
+
+
+class Corpus:
+    """Deterministic synthetic request bodies; the same seed gives the same corpus"""
+    def __init__(self, seed=1, size=1000, page_bytes=5000, sensitivity="medium"):
+        self.rng = random.Random(seed)
+        self.size = size
+        self.page_bytes = page_bytes
+        self.sensitivity = sensitivity
+        self.harmful_terms = [term for terms in harmful_patterns.values() for term in terms]
+
+    def _words(self, count):
+        words = [self.rng.choice(COMMON_WORDS) for _ in range(count)]
+        if self.rng.random() < HARMFUL_SHARE:
+            words[self.rng.randrange(count)] = self.rng.choice(self.harmful_terms)
+        if self.rng.random() < EDUCATIONAL_SHARE:
+            words[self.rng.randrange(count)] = self.rng.choice(educational_terms)
+        return words
+
+    def queries(self):
+        return [
+            {"query": " ".join(self._words(self.rng.randint(2, 8))), "sensitivity": self.sensitivity}
+            for _ in range(self.size)
+        ]
+
+    def pages(self):
+        pages = []
+        for index in range(self.size):
+            lines = []
+            size = 0
+            while size < self.page_bytes:
+                line = " ".join(self._words(self.rng.randint(8, 20))).capitalize() + "."
+                lines.append(line)
+                size += len(line) + 1
+            pages.append({
+                "url": f"https://example.com/page/{index}",
+                "title": " ".join(self._words(5)).title(),
+                "content": "\n".join(lines)[:self.page_bytes],
+                "sensitivity": self.sensitivity
+            })
+        return pages
+
+    def domains(self):
+        domains = []
+        for _ in range(self.size):
+            labels = [self.rng.choice(DOMAIN_WORDS) for _ in range(self.rng.randint(1, 2))]
+            if self.rng.random() < HARMFUL_SHARE:
+                term = self.rng.choice(self.harmful_terms).replace(" ", "")
+                labels.insert(self.rng.randrange(len(labels) + 1), term)
+            host = "".join(labels) + str(self.rng.randrange(1000)) + "." + self.rng.choice(DOMAIN_TLDS)
+            if self.rng.random() < 0.5:
+                host = "www." + host
+            domains.append({"domain": host, "sensitivity": self.sensitivity})
+        return domains
+
+    def images(self, base_url, fixtures):
+        # A query string per item makes each URL a distinct cache entry
+        return [
+            {"image_url": f"{base_url}/{self.rng.choice(fixtures)}?n={index}", "sensitivity": self.sensitivity}
+            for index in range(self.size)
+        ]
+
+
+def make_png(width, height, rng, tile=16):
+    """Encode a tiled colour image as PNG with the standard library only"""
+    columns = -(-width // tile)
+    rows = []
+    for y in range(0, height, tile):
+        colours = [bytes(rng.randrange(256) for _ in range(3)) for _ in range(columns)]
+        row = b"\x00" + b"".join(colour * tile for colour in colours)[:width * 3]
+        rows.extend([row] * min(tile, height - y))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b""))
+
+
+class FixtureServer:
+    """Serves generated image fixtures over HTTP on a free local port"""
+    def __init__(self, count=8, width=640, height=480, seed=1):
+        rng = random.Random(seed)
+        self.fixtures = {f"img{index}.png": make_png(width, height, rng) for index in range(count)}
+        fixtures = self.fixtures
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, with_body):
+                body = fixtures.get(self.path.split("?", 1)[0].lstrip("/"))
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if with_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(True)
+
+            def do_HEAD(self):
+                self._respond(False)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def start_local_server():
+    """Run the Flask app on a threaded local server; returns (base URL, server)"""
+    from werkzeug.serving import make_server
+    from server import app
+
+    httpd = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_port}", httpd
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_load(url, bodies, total, concurrency, warmup=0, verify=True, timeout=30):
+    """
+    Closed-loop load: concurrency threads each send the next body as soon as
+    their previous response arrives. Returns latency and error statistics
+    """
+    local = threading.local()
+    counter = iter(range(warmup + total))
+    counter_lock = threading.Lock()
+    latencies = []
+    errors = {}
+    results_lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.verify = verify
+        return local.session
+
+    def worker(record_from):
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            body = bodies[index % len(bodies)]
+            started = time.perf_counter()
+            try:
+                response = session().post(url, json=body, timeout=timeout)
+                error = None if response.status_code == 200 else f"status_{response.status_code}"
+            except requests.RequestException as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if index < record_from:
+                continue
+            with results_lock:
+                latencies.append(elapsed)
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+
+    # Warm-up requests go first and are not recorded
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker, warmup)
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "duration_s": duration,
+        "throughput_rps": count / duration if duration else 0.0,
+        "latency_ms": {
+            "mean": sum(latencies) / count * 1000 if count else 0.0,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000 if count else 0.0
+        }
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare_results(baseline, current, tolerance):
+    """
+    Compare two result files endpoint by endpoint
+    Returns (report lines, number of regressions beyond tolerance)
+    """
+    lines = []
+    regressions = 0
+    for endpoint, result in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if base is None:
+            continue
+        checks = [("throughput_rps", base["throughput_rps"], result["throughput_rps"], False)]
+        checks += [
+            (f"{name} ms", base["latency_ms"][name], result["latency_ms"][name], True)
+            for name in ("p50", "p95", "p99")
+        ]
+        for name, old, new, lower_is_better in checks:
+            change = (new - old) / old if old else 0.0
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            regressions += worse
+            lines.append(
+                f"{endpoint:16} {name:15} {old:10.2f} -> {new:10.2f} ({change:+.1%})"
+                + ("  REGRESSION" if worse else "")
+            )
+    return lines, regressions
+
+
+def print_results(results):
+    print(f"{'endpoint':16} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for endpoint, result in results["endpoints"].items():
+        latency = result["latency_ms"]
+        print(f"{endpoint:16} {result['throughput_rps']:9.1f} {latency['p50']:9.2f} "
+              f"{latency['p95']:9.2f} {latency['p99']:9.2f} {sum(result['errors'].values()):7d}")
+
+
+def run(args):
+    corpus = Corpus(seed=args.seed, size=args.corpus_size, page_bytes=args.page_bytes,
+                    sensitivity=args.sensitivity)
+    fixtures = FixtureServer(count=args.image_fixtures, width=args.image_width,
+                             height=args.image_height, seed=args.seed)
+
+    base_url = args.url.rstrip("/") if args.url else None
+    local_server = None
+    if base_url is None:
+        base_url, local_server = start_local_server()
+
+    corpora = {
+        "analyze_query": corpus.queries,
+        "analyze_content": corpus.pages,
+        "check_domain": corpus.domains,
+        "analyze_image": lambda: corpus.images(fixtures.url, list(fixtures.fixtures))
+    }
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": args.url or "in-process",
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "git_revision": git_revision()
+        },
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "corpus_size": args.corpus_size,
+            "page_bytes": args.page_bytes,
+            "sensitivity": args.sensitivity,
+            "seed": args.seed,
+            "image_size": [args.image_width, args.image_height]
+        },
+        "endpoints": {}
+    }
+
+    try:
+        for endpoint in args.endpoints:
+            print(f"Running {endpoint}: {args.requests} requests at concurrency {args.concurrency}",
+                  file=sys.stderr)
+            results["endpoints"][endpoint] = run_load(
+                f"{base_url}/{endpoint}", corpora[endpoint](), args.requests, args.concurrency,
+                warmup=args.warmup, verify=not args.insecure
+            )
+    finally:
+        fixtures.close()
+        if local_server is not None:
+            local_server.shutdown()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare_results(baseline, results, args.tolerance)
+        print("\n".join(lines))
+        return 1 if regressions else 0
+    return 0
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="SafeGuard API benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Load-test the endpoints")
+    run_parser.add_argument("--url", help="Base URL of a running server (default: start one in-process)")
+    run_parser.add_argument("--insecure", action="store_true", help="Skip TLS certificate checks")
+    run_parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--requests", type=int, default=500, help="Measured requests per endpoint")
+    run_parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint")
+    run_parser.add_argument(
+        "--corpus-size", type=int, default=1000,
+        help="Distinct bodies per endpoint; smaller than --requests means repeats hit the caches"
+    )
+    run_parser.add_argument("--page-bytes", type=int, default=5000)
+    run_parser.add_argument("--sensitivity", choices=["low", "medium", "high"], default="medium")
+    run_parser.add_argument("--image-fixtures", type=int, default=8)
+    run_parser.add_argument("--image-width", type=int, default=640)
+    run_parser.add_argument("--image-height", type=int, default=480)
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--output", help="Write the results as JSON")
+    run_parser.add_argument("--baseline", help="Compare against a saved result file")
+    run_parser.add_argument("--tolerance", type=float, default=0.10,
+                            help="Relative change counted as a regression")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two saved result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.10)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        lines, regressions = compare_results(baseline, current, args.tolerance)
+        print("\n".join(lines))
+        return 1 if regressions else 0
+
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+SafeGuard Content Filter - Caching Module
+Provides a bounded, thread-safe cache with TTL expiry and LRU eviction,
+and a variant that spills evicted entries to disk
+"""
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    In-memory cache bounded by entry count
+    Entries expire ttl seconds after they are stored; when the cache is full the
+    least recently used entry is evicted
+    """
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entries if needed
+        ttl overrides the cache's lifetime for this entry
+        """
+        self._store(key, value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def _store(self, key, value, expires_at):
+        """Insert an entry with an explicit monotonic expiry time"""
+        if self.maxsize <= 0:
+            return
+        evicted = []
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted_key, (evicted_value, evicted_expires_at) = self._entries.popitem(last=False)
+                self.evictions += 1
+                evicted.append((evicted_key, evicted_value, evicted_expires_at))
+        # Slow eviction hooks (disk writes) must not hold up other lookups
+        for evicted_key, evicted_value, evicted_expires_at in evicted:
+            self._on_evict(evicted_key, evicted_value, evicted_expires_at)
+
+    def _on_evict(self, key, value, expires_at):
+        """Hook for subclasses; called after the lock is released for each evicted entry"""
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+class SpillingTTLCache(TTLCache):
+    """
+    TTLCache that writes LRU-evicted entries to a directory as JSON files
+    and reads them back on an in-memory miss; keys must be filename-safe
+    strings (e.g. hex digests) and values JSON-serializable
+    At most max_files entries are kept on disk (the oldest spills are deleted
+    first) and expired files are swept every sweep_interval seconds
+    """
+    def __init__(self, maxsize=10000, ttl=300, directory=None, max_files=100000, sweep_interval=60):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.directory = directory
+        self.max_files = max_files
+        self.sweep_interval = sweep_interval
+        self.disk_hits = 0
+        self.disk_evictions = 0
+
+        # Spilled keys in spill order -> wall-clock expiry time
+        self._spilled = OrderedDict()
+        self._spill_lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._index_directory()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _index_directory(self):
+        """Index files left by an earlier process; write time + ttl bounds their expiry"""
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".tmp"):
+                    os.remove(path)
+                elif name.endswith(".json"):
+                    found.append((os.path.getmtime(path), name[:-len(".json")]))
+            except OSError:
+                pass
+        for written_at, key in sorted(found):
+            self._spilled[key] = written_at + self.ttl
+        self._remove_files(self._take_stale(time.time()))
+
+    def _take_stale(self, now):
+        """
+        Drop expired keys and keys beyond max_files from the index and return them
+        Expects the spill lock to be held, or no other thread to use the cache yet
+        """
+        stale = [key for key, expires_at in self._spilled.items() if expires_at <= now]
+        for key in stale:
+            del self._spilled[key]
+        while len(self._spilled) > max(0, self.max_files):
+            key, _ = self._spilled.popitem(last=False)
+            stale.append(key)
+        self.disk_evictions += len(stale)
+        return stale
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _on_evict(self, key, value, expires_at):
+        if not self.directory or self.max_files <= 0:
+            return
+        # Convert the monotonic deadline to wall-clock time so it survives restarts
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            return
+        wall_expires_at = time.time() + remaining
+        try:
+            temp_path = self._path(key) + f".{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"expires_at": wall_expires_at, "value": value}, f)
+            os.replace(temp_path, self._path(key))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Cache spill error: {str(e)}")
+            return
+
+        now = time.monotonic()
+        with self._spill_lock:
+            self._spilled[key] = wall_expires_at
+            self._spilled.move_to_end(key)
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.sweep_interval
+                stale = self._take_stale(time.time())
+            elif len(self._spilled) > self.max_files:
+                stale = self._take_stale(0)
+            else:
+                stale = []
+        self._remove_files(stale)
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        if value is not default or not self.directory:
+            return value
+
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return default
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        with self._spill_lock:
+            self._spilled.pop(key, None)
+
+        remaining = entry.get("expires_at", 0) - time.time()
+        if remaining <= 0:
+            return default
+
+        # Promote back into memory with the remaining lifetime
+        with self._lock:
+            self.disk_hits += 1
+        self._store(key, entry["value"], time.monotonic() + remaining)
+        return entry["value"]
+
+    def clear(self):
+        """Drop every entry, in memory and on disk (counters are kept)"""
+        super().clear()
+        if not self.directory:
+            return
+        with self._spill_lock:
+            self._spilled.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") or name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        stats = super().stats()
+        stats["disk_hits"] = self.disk_hits
+        with self._spill_lock:
+            stats["disk_size"] = len(self._spilled)
+        stats["disk_evictions"] = self.disk_evictions
+        return stats
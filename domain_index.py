@@ -0,0 +1,331 @@
+"""
+SafeGuard Content Filter - Domain Reputation Module
+Provides a hashed suffix index of known harmful domains so that a lookup
+costs one set probe per hostname label, with atomic hot reload from a file.
+Large lists can be compiled into a compact binary file that is memory-mapped
+read-only, so every worker process shares one page-cache copy
+"""
+import os
+import sys
+import mmap
+import time
+import struct
+import hashlib
+import argparse
+import threading
+from array import array
+from bisect import bisect_left
+
+# Built-in entries, always blocked regardless of sensitivity
+DEFAULT_HARMFUL_DOMAINS = [
+    "pornhub.com", "xvideos.com", "xnxx.com",
+    "bestgore.com", "liveleak.com",
+    "suicidemethod.com", "howtokillmyself.com"
+]
+
+# Optional blocklist file (one domain per line; hosts-file lines are accepted too)
+DOMAIN_BLOCKLIST_PATH = os.getenv("DOMAIN_BLOCKLIST_PATH", "")
+
+# Seconds between checks of the blocklist file's modification time
+DOMAIN_BLOCKLIST_CHECK_INTERVAL = float(os.getenv("DOMAIN_BLOCKLIST_CHECK_INTERVAL", "30"))
+
+
+def normalize_domain(domain):
+    """Lowercase a hostname and strip surrounding whitespace, a port and a trailing dot"""
+    domain = domain.strip().lower()
+    if ":" in domain and not domain.startswith("["):
+        domain = domain.split(":", 1)[0]
+    return domain.rstrip(".")
+
+
+def parse_domain_line(line):
+    """
+    Extract the domain from one blocklist line
+    Accepts plain domains and hosts-file entries ("0.0.0.0 example.com"); returns None for comments
+    """
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+    fields = line.split()
+    domain = normalize_domain(fields[-1])
+    return domain or None
+
+
+# Binary blocklist layout (little-endian):
+#   header  magic, version, entry count, bloom filter bits, bloom hash count, padding
+#   bloom   bloom filter bit array, padded to a multiple of 8 bytes
+#   hashes  sorted unique 64-bit domain hashes
+BLOCKLIST_MAGIC = b"SGDB"
+BLOCKLIST_VERSION = 1
+BLOCKLIST_HEADER = struct.Struct("<4sIQQII")
+
+
+def domain_hash(domain):
+    """64-bit hash of a normalized domain, used by the binary blocklist"""
+    return int.from_bytes(
+        hashlib.blake2b(domain.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def _bloom_positions(value, bloom_bits, bloom_hashes):
+    """Double hashing: derive every bloom probe from the two halves of one hash"""
+    h1 = value & 0xFFFFFFFF
+    h2 = (value >> 32) | 1
+    return [(h1 + i * h2) % bloom_bits for i in range(bloom_hashes)]
+
+
+def build_binary_blocklist(domains, output_path, bloom_bits_per_entry=10):
+    """
+    Write domains as a binary blocklist
+    Returns the number of unique entries written
+    """
+    hashes = array("Q", sorted({domain_hash(domain) for domain in domains}))
+    count = len(hashes)
+
+    bloom_bits = 0
+    bloom_hashes = 0
+    bloom = bytearray()
+    if bloom_bits_per_entry > 0 and count:
+        bloom_bits = max(64, count * bloom_bits_per_entry)
+        bloom_bits += -bloom_bits % 64
+        bloom_hashes = max(1, round(0.693 * bloom_bits_per_entry))
+        bloom = bytearray(bloom_bits // 8)
+        for value in hashes:
+            for position in _bloom_positions(value, bloom_bits, bloom_hashes):
+                bloom[position >> 3] |= 1 << (position & 7)
+
+    if sys.byteorder != "little":
+        hashes.byteswap()
+
+    temp_path = output_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(BLOCKLIST_HEADER.pack(
+            BLOCKLIST_MAGIC, BLOCKLIST_VERSION, count, bloom_bits, bloom_hashes, 0
+        ))
+        f.write(bloom)
+        hashes.tofile(f)
+    # Readers hot-reloading the old file keep their mapping; the swap is atomic
+    os.replace(temp_path, output_path)
+    return count
+
+
+def is_binary_blocklist(path):
+    """Check the magic bytes at the start of a blocklist file"""
+    with open(path, "rb") as f:
+        return f.read(len(BLOCKLIST_MAGIC)) == BLOCKLIST_MAGIC
+
+
+class MappedDomainSet:
+    """
+    Read-only, memory-mapped binary blocklist
+    Membership is a bloom filter probe followed by a binary search over the
+    sorted hash array; pages are shared between processes through the page cache
+    """
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("Binary blocklists can only be mapped on little-endian hosts")
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, bloom_bits, bloom_hashes, _ = BLOCKLIST_HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != BLOCKLIST_MAGIC or version != BLOCKLIST_VERSION:
+            raise ValueError(f"{path} is not a version {BLOCKLIST_VERSION} binary blocklist")
+
+        view = memoryview(self._mmap)
+        bloom_start = BLOCKLIST_HEADER.size
+        hashes_start = bloom_start + bloom_bits // 8
+        self._count = count
+        self._bloom_bits = bloom_bits
+        self._bloom_hashes = bloom_hashes
+        self._bloom = view[bloom_start:hashes_start]
+        self._hashes = view[hashes_start:hashes_start + count * 8].cast("Q")
+
+    def __contains__(self, domain):
+        value = domain_hash(domain)
+
+        if self._bloom_bits:
+            bloom = self._bloom
+            for position in _bloom_positions(value, self._bloom_bits, self._bloom_hashes):
+                if not bloom[position >> 3] & (1 << (position & 7)):
+                    return False
+
+        index = bisect_left(self._hashes, value)
+        return index < self._count and self._hashes[index] == value
+
+    def __len__(self):
+        return self._count
+
+
+def load_domain_file(path):
+    """Read a plain-text blocklist into a set of normalized domains"""
+    domains = set()
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            domain = parse_domain_line(line)
+            if domain:
+                domains.add(domain)
+    return domains
+
+
+class DomainBlocklist:
+    """
+    Known harmful domains, matched on label boundaries
+    A hostname matches when it or any parent domain is listed, so
+    "www.pornhub.com" matches "pornhub.com" but "notpornhub.com.example" does not
+    """
+    def __init__(self, path=DOMAIN_BLOCKLIST_PATH, defaults=DEFAULT_HARMFUL_DOMAINS,
+                 check_interval=DOMAIN_BLOCKLIST_CHECK_INTERVAL):
+        self.path = path
+        self.defaults = frozenset(normalize_domain(domain) for domain in defaults)
+        self.check_interval = check_interval
+
+        # Sets probed on each lookup: the defaults plus the loaded file
+        self._entries = (self.defaults,)
+        self._loaded_mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self._listeners = []
+
+        if self.path:
+            self.reload()
+
+    def add_reload_listener(self, callback):
+        """Register a callback to run after a reload swaps in new entries"""
+        self._listeners.append(callback)
+
+    def reload(self):
+        """
+        Build a new index from the blocklist file and swap it in atomically
+        Lookups keep using the previous index until the new one is complete
+        """
+        with self._reload_lock:
+            if not self.path:
+                return False
+            try:
+                mtime = os.path.getmtime(self.path)
+                started = time.perf_counter()
+                if is_binary_blocklist(self.path):
+                    entries = (self.defaults, MappedDomainSet(self.path))
+                else:
+                    entries = (self.defaults | frozenset(load_domain_file(self.path)),)
+            except (OSError, ValueError) as e:
+                print(f"Domain blocklist load error: {str(e)}")
+                return False
+
+            self._entries = entries
+            self._loaded_mtime = mtime
+            print(
+                f"Loaded {len(self)} blocked domains from {self.path} "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+
+        for callback in self._listeners:
+            callback()
+        return True
+
+    def maybe_reload(self):
+        """
+        Start a background reload if the file changed; the file is stat'ed at most
+        once per check_interval. Lookups never wait for the new index to be built
+        """
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._loaded_mtime:
+            thread = self._reload_thread
+            if thread is not None and thread.is_alive():
+                return
+            self._reload_thread = threading.Thread(
+                target=self.reload, name="blocklist-reload", daemon=True
+            )
+            self._reload_thread.start()
+
+    def match(self, hostname):
+        """
+        Return the listed domain that hostname falls under, or None
+        Probes each suffix on a label boundary, from the full hostname up
+        """
+        self.maybe_reload()
+        entries = self._entries
+
+        hostname = normalize_domain(hostname)
+        while hostname:
+            if any(hostname in entry_set for entry_set in entries):
+                return hostname
+            dot = hostname.find(".")
+            if dot < 0:
+                return None
+            hostname = hostname[dot + 1:]
+        return None
+
+    def __contains__(self, hostname):
+        return self.match(hostname) is not None
+
+    def __len__(self):
+        return sum(len(entry_set) for entry_set in self._entries)
+
+
+def resident_memory_mb():
+    """Current resident set size of this process in MB (Linux), or peak RSS elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    """Command line tool: compile a plain-text blocklist and inspect binary ones"""
+    parser = argparse.ArgumentParser(description="SafeGuard domain blocklist tool")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Compile a text blocklist to binary")
+    build_parser.add_argument("input", help="Plain-text or hosts-file blocklist")
+    build_parser.add_argument("output", help="Binary blocklist to write")
+    build_parser.add_argument(
+        "--bloom-bits", type=int, default=10,
+        help="Bloom filter bits per entry (0 disables the prefilter)"
+    )
+
+    check_parser = subparsers.add_parser("check", help="Load a blocklist and look up domains")
+    check_parser.add_argument("blocklist", help="Binary or text blocklist")
+    check_parser.add_argument("domains", nargs="*", help="Hostnames to look up")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        domains = load_domain_file(args.input)
+        parsed = time.perf_counter()
+        count = build_binary_blocklist(domains, args.output, args.bloom_bits)
+        built = time.perf_counter()
+        print(f"Parsed {len(domains)} domains in {parsed - started:.2f}s")
+        print(f"Wrote {count} entries to {args.output} in {built - parsed:.2f}s "
+              f"({os.path.getsize(args.output) / (1024 * 1024):.1f} MB)")
+        del domains
+
+    path = args.output if args.command == "build" else args.blocklist
+    rss_before = resident_memory_mb()
+    started = time.perf_counter()
+    blocklist = DomainBlocklist(path=path, defaults=())
+    print(f"Load time: {(time.perf_counter() - started) * 1000:.1f} ms, "
+          f"resident memory: {rss_before:.1f} MB -> {resident_memory_mb():.1f} MB")
+
+    for domain in getattr(args, "domains", []):
+        print(f"{domain}: {blocklist.match(domain) or 'not listed'}")
+
+
+if __name__ == "__main__":
+    main()
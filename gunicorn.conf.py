@@ -0,0 +1,92 @@
+"""
+SafeGuard Content Filter - Gunicorn Configuration
+Production serving: gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden with the environment variable named next to it.
+Serves plain HTTP unless TLS_CERTFILE and TLS_KEYFILE point to this
+deployment's certificate and private key.
+Graceful operations on the master process:
+    kill -HUP <master>    re-read this file and replace workers once their
+                          in-flight requests finish
+    kill -USR2 <master>   start a new master with new code (the app is
+                          preloaded, so code changes need this), then
+                          kill -TERM the old master
+    kill -TERM <master>   stop accepting, finish in-flight requests, exit
+"""
+import os
+import gc
+import glob
+import tempfile
+import multiprocessing
+
+# Listening socket
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+
+# Threaded workers: idle keep-alive connections wait in a poller instead of
+# holding a thread, so each worker can keep many extension clients connected
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", str(multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Keep connections open between the extension's bursts of requests
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+
+# Request timeouts and graceful shutdown window
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Optionally recycle workers after a number of requests (0 disables)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Load the app (pattern engines, blocklist, models) once in the master
+preload_app = True
+
+# Workers share their metrics through this directory so any worker can answer a
+# scrape for all of them (read by metrics.py, so it is set before the app loads)
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="safeguard-metrics-"))
+
+# TLS termination only with a certificate and key provided for this deployment;
+# the server.crt/server.key in the repository are public, development-only files
+_certfile = os.getenv("TLS_CERTFILE", "")
+_keyfile = os.getenv("TLS_KEYFILE", "")
+if _certfile and _keyfile:
+    certfile = _certfile
+    keyfile = _keyfile
+elif _certfile or _keyfile:
+    raise RuntimeError("TLS needs both TLS_CERTFILE and TLS_KEYFILE")
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Series left by the workers of an earlier run would be reported forever
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "worker-*.json*")):
+        os.remove(path)
+
+
+def when_ready(server):
+    # Move everything the preloaded app allocated out of the garbage collector's
+    # reach, so collections in the workers do not touch (and copy) shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from wsgi import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    # Image worker processes belong to this worker; do not leave them behind
+    from image_workers import shutdown_worker_pool
+    shutdown_worker_pool()
+
+
+def child_exit(server, worker):
+    # Runs in the master: drop the exited worker's series from scrapes
+    from metrics import remove_worker_snapshot
+    remove_worker_snapshot(worker.pid)
@@ -0,0 +1,285 @@
+"""
+SafeGuard Content Filter - HTTP Client Module
+Shared connection-pooled sessions for all outbound calls, with connect/read
+timeouts, bounded retries with backoff, per-host concurrency limits and a
+per-host circuit breaker that sends callers to their fallback path
+"""
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import record_upstream_error
+
+# Timeouts in seconds
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+
+# Connection pools: number of hosts kept and connections kept per host
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "20"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+
+# Maximum concurrent requests to one host; callers wait at most the connect timeout
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "10"))
+
+# Retries for connection errors and 502/503/504 responses
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.2"))
+
+# Circuit breaker: consecutive failures before opening, seconds before a trial request
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Hosts whose breaker and concurrency slots are kept; image URLs reach arbitrary
+# hosts, so the least recently used healthy hosts are forgotten beyond this
+HTTP_MAX_TRACKED_HOSTS = int(os.getenv("HTTP_MAX_TRACKED_HOSTS", "1000"))
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a host whose circuit breaker is open"""
+
+
+class HostBusyError(requests.RequestException):
+    """Raised when a host already has the maximum number of requests in flight"""
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures for one host
+    After failure_threshold failures the circuit opens and requests fail fast;
+    after reset_timeout one trial request is let through to probe the host
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow_request(self):
+        """Return True if a request may be sent to the host"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            # A failed trial re-opens the circuit; otherwise open once the threshold is hit
+            if self.trial_in_flight or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial that never reached the host"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    @property
+    def healthy(self):
+        """True when the circuit is closed with no failures counted (nothing to remember)"""
+        return self.opened_at is None and self.failures == 0
+
+
+# Per-process session (sessions must not be shared across a fork) and per-host
+# state: host -> (breaker, concurrency slots), least recently used first
+_session = None
+_session_pid = None
+_hosts = OrderedDict()
+_state_lock = threading.Lock()
+
+
+def _build_session():
+    """Create a session whose adapters pool connections and retry transient failures"""
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["HEAD", "GET", "POST"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """Return the shared session for this process"""
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _state_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def get_breaker(host):
+    """Return the circuit breaker for a host (for callers using their own transport)"""
+    return _host_state(host)[0]
+
+
+def _host_state(host):
+    """Return the (breaker, concurrency slots) pair for a host"""
+    with _state_lock:
+        state = _hosts.get(host)
+        if state is not None:
+            _hosts.move_to_end(host)
+            return state
+
+        state = _hosts[host] = (
+            CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT),
+            threading.BoundedSemaphore(HTTP_MAX_PER_HOST)
+        )
+        if len(_hosts) > HTTP_MAX_TRACKED_HOSTS:
+            _forget_host()
+        return state
+
+
+def _forget_host():
+    """
+    Drop the least recently used healthy host, or the least recently used host
+    when every tracked host is failing; called with the state lock held.
+    Requests still in flight keep the slots they hold, so a forgotten host can
+    briefly see up to twice its concurrency limit
+    """
+    for host, (breaker, _) in _hosts.items():
+        if breaker.healthy:
+            break
+    else:
+        host = next(iter(_hosts))
+    del _hosts[host]
+
+
+def request(method, url, timeout=None, upstream="other", **kwargs):
+    """
+    Send a request through the shared session
+    Raises CircuitOpenError or HostBusyError (both requests exceptions) when
+    the host should not be called right now, so callers take their fallback path.
+    upstream names the kind of service in error metrics (hosts are unbounded).
+    With stream=True the host slot is held until the response is closed (use it
+    as a context manager), since the body is still being read after this returns
+    """
+    host = urlparse(url).netloc
+    breaker, slots = _host_state(host)
+
+    if not breaker.allow_request():
+        record_upstream_error(upstream, "circuit_open")
+        raise CircuitOpenError(f"Circuit open for {host}")
+    if not slots.acquire(timeout=HTTP_CONNECT_TIMEOUT):
+        breaker.release_trial()
+        record_upstream_error(upstream, "host_busy")
+        raise HostBusyError(f"Too many requests in flight to {host}")
+
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+    hold_slot = False
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+        hold_slot = bool(kwargs.get("stream"))
+    except requests.RequestException:
+        breaker.record_failure()
+        record_upstream_error(upstream, "connection")
+        raise
+    finally:
+        if not hold_slot:
+            slots.release()
+    if hold_slot:
+        _release_on_close(response, slots)
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+        record_upstream_error(upstream, "status_5xx")
+    else:
+        breaker.record_success()
+    return response
+
+
+def _release_on_close(response, slots):
+    """
+    Give the host slot back when a streamed response is closed, or when it is
+    garbage collected without being closed
+    """
+    release = weakref.finalize(response, slots.release)
+    close = response.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+
+    response.close = close_and_release
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
+
+
+def breaker_stats():
+    """
+    Return the number of hosts tracked and the state of every circuit that is
+    open or half-open (closed circuits are not listed)
+    """
+    with _state_lock:
+        breakers = [(host, breaker) for host, (breaker, _) in _hosts.items()]
+    open_circuits = {}
+    for host, breaker in breakers:
+        state = breaker.state
+        if state != "closed":
+            open_circuits[host] = {
+                "state": state,
+                "consecutive_failures": breaker.failures,
+                "times_opened": breaker.times_opened
+            }
+    return {"tracked_hosts": len(breakers), "open_circuits": open_circuits}
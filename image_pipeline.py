@@ -0,0 +1,327 @@
+"""
+SafeGuard Content Filter - Async Image Pipeline Module
+Runs image downloads on a dedicated asyncio event loop so that many analyses
+can be in flight at once, sharing one fetch between concurrent requests for
+the same URL and capping concurrent downloads per origin
+"""
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import http_client
+from metrics import stage_timer, record_upstream_error
+from vision_processor import (
+    get_detector, url_cache, CV2_AVAILABLE, IMAGE_MAX_BYTES, IMAGE_CHUNK_SIZE, IMAGE_FETCH_DEADLINE,
+    ImageRejectedError, check_image_headers, sniff_image_format, read_capped,
+    fetch_image_bytes, error_verdict
+)
+
+# Optional native async HTTP client; blocking downloads run on a thread pool without it
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Maximum concurrent downloads per origin (scheme://host:port)
+IMAGE_MAX_PER_ORIGIN = int(os.getenv("IMAGE_MAX_PER_ORIGIN", "8"))
+
+# Seconds a request thread waits for its analysis before giving up
+IMAGE_PIPELINE_TIMEOUT = float(os.getenv("IMAGE_PIPELINE_TIMEOUT", "20"))
+
+# Threads for decoding and for blocking work (API detection, fetches without aiohttp)
+IMAGE_PIPELINE_THREADS = int(os.getenv("IMAGE_PIPELINE_THREADS", "16"))
+
+
+def parse_image_url(image_url):
+    """Return the parsed URL, or None unless it is an http(s) URL string with a host"""
+    if not isinstance(image_url, str):
+        return None
+    try:
+        parsed = urlparse(image_url)
+    except ValueError:
+        return None
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        return None
+    return parsed
+
+
+class ImagePipeline:
+    """
+    Event loop running in a background thread
+    Request threads submit URLs with analyze() and block only on their own result
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(
+            IMAGE_PIPELINE_THREADS, thread_name_prefix="image-pipeline"
+        )
+
+        # URL -> task of an analysis currently running, shared by duplicate requests
+        self.in_flight = {}
+        # Origin -> [semaphore limiting concurrent downloads, downloads using it];
+        # an entry is dropped when its last download finishes
+        self.origin_limits = {}
+        self.session = None
+
+        self.thread = threading.Thread(target=self._run, name="image-pipeline", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def analyze(self, image_url, timeout=IMAGE_PIPELINE_TIMEOUT):
+        """Analyze one image URL from a request thread"""
+        future = asyncio.run_coroutine_threadsafe(self.analyze_async(image_url), self.loop)
+        return future.result(timeout)
+
+    async def analyze_async(self, image_url):
+        """Return a cached verdict, join an in-flight analysis, or start a new one"""
+        cached = url_cache.get(image_url)
+        if cached is not None:
+            return cached
+
+        task = self.in_flight.get(image_url)
+        if task is None:
+            task = self.loop.create_task(self._analyze_uncached(image_url))
+            self.in_flight[image_url] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(image_url, None))
+
+        # Shield so one caller timing out does not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    def analyze_many(self, images, timeout=IMAGE_PIPELINE_TIMEOUT):
+        """
+        Analyze a batch of images given as ("url", image_url) or ("bytes", content)
+        from a request thread; returns one result per image, in order
+        """
+        future = asyncio.run_coroutine_threadsafe(self.analyze_many_async(images), self.loop)
+        return future.result(timeout)
+
+    async def analyze_many_async(self, images):
+        """
+        Fetch every uncached URL concurrently, then analyze all downloaded and
+        inline images together so a local model sees them as one batch
+        """
+        detector = get_detector()
+        results = [None] * len(images)
+        # Index -> task; a URL repeated within the batch is fetched once
+        url_tasks = {}
+        tasks_by_url = {}
+        
+        for index, (kind, value) in enumerate(images):
+            if kind != "url":
+                continue
+            cached = url_cache.get(value)
+            if cached is not None:
+                results[index] = cached
+                continue
+            task = tasks_by_url.get(value)
+            if task is None:
+                if detector.uses_remote_api or not CV2_AVAILABLE:
+                    task = asyncio.ensure_future(self.analyze_async(value))
+                else:
+                    task = asyncio.ensure_future(self._download(value))
+                tasks_by_url[value] = task
+            url_tasks[index] = task
+        
+        fetched = await asyncio.gather(*url_tasks.values(), return_exceptions=True)
+        
+        downloaded = []
+        for index, outcome in zip(url_tasks, fetched):
+            if isinstance(outcome, dict):
+                # Full verdict from the per-URL path (remote API / no OpenCV)
+                results[index] = outcome
+            elif isinstance(outcome, BaseException):
+                print(f"Image fetch error: {str(outcome)}")
+                results[index] = error_verdict(outcome)
+            else:
+                downloaded.append((index, images[index][1], outcome))
+        downloaded.extend(
+            (index, "", value) for index, (kind, value) in enumerate(images) if kind != "url"
+        )
+        
+        if detector.batches_locally:
+            # One model call for the whole batch; it reports failures per image
+            verdicts = await self.loop.run_in_executor(
+                self.executor, detector.analyze_downloaded_images,
+                [(image_url, content) for _, image_url, content in downloaded]
+            )
+        else:
+            # Without a model each image is its own worker pool task
+            verdicts = await asyncio.gather(*(
+                self.loop.run_in_executor(
+                    self.executor, detector.analyze_downloaded_image_safely, image_url, content
+                )
+                for _, image_url, content in downloaded
+            ))
+        for (index, image_url, _), verdict in zip(downloaded, verdicts):
+            if image_url and 'error' not in verdict:
+                url_cache.set(image_url, verdict)
+            results[index] = verdict
+        return results
+
+    async def _download(self, image_url):
+        """Validate the URL and fetch its bytes; raises on rejected or failed downloads"""
+        parsed = parse_image_url(image_url)
+        if parsed is None:
+            raise ImageRejectedError("Invalid image URL")
+        return await self._fetch(parsed, image_url)
+
+    async def _analyze_uncached(self, image_url):
+        detector = get_detector()
+
+        if detector.uses_remote_api or not CV2_AVAILABLE:
+            # The remote API fetches the image itself; no download to overlap here
+            result = await self.loop.run_in_executor(
+                self.executor, detector.analyze_image, image_url
+            )
+        else:
+            result = await self._local_analysis(detector, image_url)
+
+        # Errors are usually transient (network, upstream API), so only cache verdicts
+        if 'error' not in result:
+            url_cache.set(image_url, result)
+        return result
+
+    async def _local_analysis(self, detector, image_url):
+        """Download once (no separate HEAD requests), then decode off the event loop"""
+        parsed = parse_image_url(image_url)
+        if parsed is None:
+            return {
+                "nsfw_probability": 0.0,
+                "detected_objects": [],
+                "error": "Invalid image URL"
+            }
+
+        try:
+            content = await self._fetch(parsed, image_url)
+        except Exception as e:
+            # Includes non-image and oversize downloads rejected while streaming
+            print(f"Image fetch error: {str(e)}")
+            return {
+                "nsfw_probability": 0.0,
+                "detected_objects": [],
+                "error": str(e)
+            }
+
+        # Worker pool timeouts and decode failures answer every waiting caller
+        # with an error verdict (not cached) instead of failing their requests
+        return await self.loop.run_in_executor(
+            self.executor, detector.analyze_downloaded_image_safely, image_url, content
+        )
+
+    async def _fetch(self, parsed, image_url):
+        """Wait for a free download slot for the origin, then fetch the image"""
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        # Only the loop thread touches origin_limits, so no lock is needed
+        entry = self.origin_limits.get(origin)
+        if entry is None:
+            entry = self.origin_limits[origin] = [asyncio.Semaphore(IMAGE_MAX_PER_ORIGIN), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._fetch_limited(parsed, image_url)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.origin_limits[origin]
+
+    async def _fetch_limited(self, parsed, image_url):
+        """
+        Stream an image download with the same early rejection and size cap as
+        fetch_image_bytes
+        """
+        if not AIOHTTP_AVAILABLE:
+            return await self.loop.run_in_executor(
+                self.executor, fetch_image_bytes, image_url
+            )
+
+        # Same circuit breaker as the blocking client uses for this host
+        breaker = http_client.get_breaker(parsed.netloc)
+        if not breaker.allow_request():
+            record_upstream_error("image", "circuit_open")
+            raise http_client.CircuitOpenError(f"Circuit open for {parsed.netloc}")
+        try:
+            session = self._get_session()
+            with stage_timer("image_fetch"):
+                async with session.get(image_url) as response:
+                    if response.status >= 500:
+                        breaker.record_failure()
+                        record_upstream_error("image", "status_5xx")
+                    else:
+                        breaker.record_success()
+                    check_image_headers(
+                        response.headers.get('Content-Type', ''),
+                        response.headers.get('Content-Length'),
+                        IMAGE_MAX_BYTES
+                    )
+                    return await self._read_capped(response)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            breaker.record_failure()
+            record_upstream_error("image", "connection")
+            raise
+
+    async def _read_capped(self, response):
+        """Read an aiohttp body chunk by chunk, stopping at the size cap"""
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(IMAGE_CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > IMAGE_MAX_BYTES:
+                break
+            # Reject non-images as soon as the magic bytes are in
+            if len(chunks) == 1 and size >= 12 and sniff_image_format(chunk[:12]) is None:
+                raise ImageRejectedError("Not an image file")
+        # Same magic byte and size checks as the blocking download
+        return read_capped(chunks, IMAGE_MAX_BYTES)
+
+    def _get_session(self):
+        """Create the aiohttp session on the event loop thread"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(
+                    total=IMAGE_FETCH_DEADLINE,
+                    sock_connect=http_client.HTTP_CONNECT_TIMEOUT,
+                    sock_read=http_client.HTTP_READ_TIMEOUT
+                ),
+                connector=aiohttp.TCPConnector(limit_per_host=IMAGE_MAX_PER_ORIGIN)
+            )
+        return self.session
+
+    def stats(self):
+        """Return the number of analyses and origins currently tracked"""
+        return {
+            "in_flight": len(self.in_flight),
+            "origins": len(self.origin_limits),
+            "aiohttp": AIOHTTP_AVAILABLE
+        }
+
+
+# One pipeline per process; the loop thread does not survive a fork
+_pipeline = None
+_pipeline_pid = None
+_pipeline_lock = threading.Lock()
+
+
+def get_image_pipeline():
+    """Return the image pipeline for this process, starting it on first use"""
+    global _pipeline, _pipeline_pid
+
+    pid = os.getpid()
+    if _pipeline is None or _pipeline_pid != pid:
+        with _pipeline_lock:
+            if _pipeline is None or _pipeline_pid != pid:
+                _pipeline = ImagePipeline()
+                _pipeline_pid = pid
+    return _pipeline
+
+
+def image_pipeline_stats():
+    """Return pipeline stats, or None when this process has not started the pipeline"""
+    pipeline = _pipeline if _pipeline_pid == os.getpid() else None
+    return pipeline.stats() if pipeline is not None else None
@@ -0,0 +1,257 @@
+"""
+SafeGuard Content Filter - Image Worker Pool Module
+Runs CPU-heavy image decoding and skin tone analysis in a pool of worker
+processes, handing image bytes over through shared memory instead of pickled
+copies, so large images do not stall request threads
+"""
+import os
+import math
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_all_start_methods, get_context, shared_memory
+
+# Import error handling utility
+try:
+    import numpy as np
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Number of decode/analysis processes; 0 runs the analysis on the calling thread
+IMAGE_DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", "2"))
+
+# Seconds to wait for a worker before giving up on an image
+IMAGE_DECODE_TIMEOUT = float(os.getenv("IMAGE_DECODE_TIMEOUT", "10"))
+
+# Maximum pixels sampled for the skin tone ratio; larger images are read on an
+# evenly spaced grid, which keeps the ratio within about 0.01 of a full-image pass
+IMAGE_SKIN_SAMPLE_PIXELS = int(os.getenv("IMAGE_SKIN_SAMPLE_PIXELS", "65536"))
+
+# Skin tone range in OpenCV HSV (simplified approach)
+LOWER_SKIN = (0, 20, 70)
+UPPER_SKIN = (20, 150, 255)
+
+# Stages reported in the per-image timings
+STAGES = ("transfer", "queue", "decode", "analysis", "total")
+
+
+def skin_tone_analysis(buffer, decode_flag):
+    """
+    Decode image bytes and measure the share of skin tone pixels
+    Returns a dictionary with skin_percentage (None if the image could not be
+    decoded) and the decode/analysis timings in milliseconds
+    """
+    started = time.perf_counter()
+    img_array = np.frombuffer(buffer, np.uint8)
+    img = cv2.imdecode(img_array, decode_flag)
+    decoded = time.perf_counter()
+
+    if img is None:
+        return {
+            "skin_percentage": None,
+            "timings": {"decode": (decoded - started) * 1000, "analysis": 0.0}
+        }
+
+    # Calculate color distribution - NSFW content often has specific skin tone distributions
+    skin_percentage = skin_ratio(sample_grid(img, IMAGE_SKIN_SAMPLE_PIXELS))
+
+    return {
+        "skin_percentage": float(skin_percentage),
+        "timings": {
+            "decode": (decoded - started) * 1000,
+            "analysis": (time.perf_counter() - decoded) * 1000
+        }
+    }
+
+
+def sample_grid(img, max_pixels):
+    """
+    View of the image restricted to an evenly spaced pixel grid of at most
+    max_pixels points (no copy; the full image is returned when it is small enough)
+    """
+    height, width = img.shape[:2]
+    if max_pixels <= 0 or height * width <= max_pixels:
+        return img
+    step = math.ceil(math.sqrt(height * width / max_pixels))
+    return img[::step, ::step]
+
+
+def skin_ratio(img):
+    """Share of pixels whose HSV value falls in the skin tone range"""
+    if img.size == 0:
+        return 0.0
+    # Only the sampled pixels are converted, so the buffers here are grid-sized
+    hsv = cv2.cvtColor(np.ascontiguousarray(img), cv2.COLOR_BGR2HSV)
+    skin_mask = cv2.inRange(hsv, LOWER_SKIN, UPPER_SKIN)
+    return np.count_nonzero(skin_mask) / skin_mask.size
+
+
+def _analyze_shared(shm_name, size, decode_flag, submitted_at):
+    """Worker entry point: attach to the parent's shared memory block and analyze it"""
+    queue_ms = (time.time() - submitted_at) * 1000
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        result = skin_tone_analysis(shm.buf[:size], decode_flag)
+    finally:
+        shm.close()
+    result["timings"]["queue"] = queue_ms
+    return result
+
+
+def _warm_up_worker():
+    """Decode a tiny image so the worker has its codecs loaded before real work"""
+    tiny = cv2.imencode(".png", np.zeros((8, 8, 3), np.uint8))[1]
+    skin_tone_analysis(tiny, cv2.IMREAD_COLOR)
+    return os.getpid()
+
+
+def _worker_context():
+    """
+    Start workers from a fork server with this module (numpy/cv2) preloaded, so
+    they do not inherit the server's threads, locks or sockets
+    """
+    if "forkserver" in get_all_start_methods():
+        context = get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return get_context("spawn")
+
+
+class ImageWorkerPool:
+    """
+    Process pool for image analysis
+    Each image is copied once into a shared memory block that the worker maps
+    directly; the parent owns and unlinks the block
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=_worker_context())
+        self._lock = threading.Lock()
+        self._stage_totals = {stage: 0.0 for stage in STAGES}
+        self._stage_max = {stage: 0.0 for stage in STAGES}
+        self._images = 0
+        self._failures = 0
+
+    def analyze(self, content, decode_flag, timeout=IMAGE_DECODE_TIMEOUT):
+        """Analyze image bytes in a worker process and return the result with timings"""
+        started = time.perf_counter()
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(content)))
+        try:
+            shm.buf[:len(content)] = content
+            transferred = time.perf_counter()
+
+            future = self._executor.submit(
+                _analyze_shared, shm.name, len(content), decode_flag, time.time()
+            )
+            result = future.result(timeout)
+        except Exception:
+            with self._lock:
+                self._failures += 1
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+        timings = result["timings"]
+        timings["transfer"] = (transferred - started) * 1000
+        timings["total"] = (time.perf_counter() - started) * 1000
+        self._record(timings)
+        return result
+
+    def _record(self, timings):
+        with self._lock:
+            self._images += 1
+            for stage in STAGES:
+                value = timings.get(stage, 0.0)
+                self._stage_totals[stage] += value
+                self._stage_max[stage] = max(self._stage_max[stage], value)
+
+    def stats(self):
+        """Return per-stage average and maximum timings in milliseconds"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "images": self._images,
+                "failures": self._failures,
+                "stages_ms": {
+                    stage: {
+                        "avg": self._stage_totals[stage] / self._images if self._images else 0.0,
+                        "max": self._stage_max[stage]
+                    }
+                    for stage in STAGES
+                }
+            }
+
+    def warm_up(self, timeout=IMAGE_DECODE_TIMEOUT):
+        """
+        Start every worker process and load its image codecs
+        Submitting one job per worker at once makes the pool start them all
+        """
+        futures = [self._executor.submit(_warm_up_worker) for _ in range(self.workers)]
+        for future in futures:
+            future.result(timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# One pool per process; worker processes are not shared across a fork
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the image worker pool for this process, or None when it is disabled"""
+    global _pool, _pool_pid
+
+    if IMAGE_DECODE_WORKERS <= 0 or not CV2_AVAILABLE:
+        return None
+
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ImageWorkerPool(IMAGE_DECODE_WORKERS)
+                _pool_pid = pid
+    return _pool
+
+
+def analyze_image_bytes(content, decode_flag):
+    """
+    Skin tone analysis of image bytes, in the worker pool when enabled
+    Falls back to the calling thread if the pool is disabled or has broken
+    """
+    global _pool
+
+    pool = get_worker_pool()
+    if pool is not None:
+        try:
+            return pool.analyze(content, decode_flag)
+        except BrokenProcessPool as e:
+            print(f"Image worker pool failed, restarting: {str(e)}")
+            with _pool_lock:
+                if _pool is pool:
+                    _pool = None
+            pool.shutdown()
+
+    return skin_tone_analysis(content, decode_flag)
+
+
+def shutdown_worker_pool():
+    """Stop this process's worker pool, if it started one"""
+    global _pool
+    with _pool_lock:
+        pool = _pool if _pool_pid == os.getpid() else None
+        _pool = None
+    if pool is not None:
+        pool.shutdown()
+
+
+def worker_pool_stats():
+    """Return pool timings, or None when analysis runs inline"""
+    pool = _pool if _pool_pid == os.getpid() else None
+    return pool.stats() if pool is not None else None
@@ -0,0 +1,157 @@
+"""
+SafeGuard Content Filter - Inference Scheduling Module
+Collects concurrent inference requests into micro-batches so that a local
+model runs one forward pass for many waiting requests
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+
+
+class MicroBatchScheduler:
+    """
+    Background scheduler around a batch prediction function
+    Pending inputs are collected for up to max_wait_ms or until max_batch_size
+    inputs are waiting, then predicted together in one call. predict() waits at
+    most timeout seconds for its results
+    """
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5, name="inference", timeout=30.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.name = name
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._max_batch_size_seen = 0
+        self._batch_size_counts = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._batch_size_counts["+Inf"] = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def submit(self, inputs):
+        """Queue inputs for prediction and return one Future per input"""
+        self._ensure_worker()
+        futures = []
+        enqueued_at = time.perf_counter()
+        for item in inputs:
+            future = Future()
+            self._queue.put((item, future, enqueued_at))
+            futures.append(future)
+        return futures
+
+    def predict(self, inputs, timeout=None):
+        """
+        Queue inputs and wait for their predictions
+        Raises concurrent.futures.TimeoutError when they take longer than timeout
+        seconds in total (the scheduler's timeout by default)
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+        return [
+            future.result(max(0.0, deadline - time.monotonic()))
+            for future in self.submit(inputs)
+        ]
+
+    def _ensure_worker(self):
+        """Start the worker thread, restarting it in a forked child process"""
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid:
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != pid:
+                # Work queued before a fork belongs to the parent process
+                self._queue = queue.Queue()
+                self._worker_pid = pid
+                self._worker = threading.Thread(
+                    target=self._run, name=f"{self.name}-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        """Worker loop: gather one micro-batch and predict it"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        """Run one forward pass and hand the results back to the waiting requests"""
+        started = time.perf_counter()
+        self._record_batch(batch, started)
+
+        try:
+            outputs = list(self.predict_fn([item for item, _, _ in batch]))
+            if len(outputs) != len(batch):
+                raise RuntimeError(
+                    f"{self.name} returned {len(outputs)} outputs for {len(batch)} inputs"
+                )
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), output in zip(batch, outputs):
+            future.set_result(output)
+
+    def _record_batch(self, batch, started):
+        """Update batch size and queue wait metrics"""
+        size = len(batch)
+        with self._lock:
+            self._batches += 1
+            self._items += size
+            self._max_batch_size_seen = max(self._max_batch_size_seen, size)
+            for bucket in BATCH_SIZE_BUCKETS:
+                if size <= bucket:
+                    self._batch_size_counts[bucket] += 1
+                    break
+            else:
+                self._batch_size_counts["+Inf"] += 1
+            for _, _, enqueued_at in batch:
+                wait = started - enqueued_at
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
+
+    def stats(self):
+        """Return batch size and queue wait metrics"""
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "queue_depth": self._queue.qsize(),
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_batch_size_seen,
+                "batch_size_histogram": {
+                    str(bucket): count for bucket, count in self._batch_size_counts.items()
+                },
+                "avg_queue_wait_ms": (
+                    self._queue_wait_total / self._items * 1000 if self._items else 0.0
+                ),
+                "max_queue_wait_ms": self._queue_wait_max * 1000
+            }
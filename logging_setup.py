@@ -0,0 +1,178 @@
+"""
+SafeGuard Content Filter - Logging Module
+Keeps log I/O off the request threads: records go into a bounded in-memory
+queue and a listener thread formats and writes them. A full queue drops
+records instead of blocking, high-volume per-request lines are sampled, and
+output is one JSON object per line (or plain text with LOG_FORMAT=text)
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Minimum level written, and output format ("json" or "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Optional log file; the default is stderr
+LOG_FILE = os.getenv("LOG_FILE", "")
+
+# Records buffered for the writer thread; more are dropped and counted
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Share of per-request INFO lines (the "requests" loggers) that are kept
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "0.1"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed with extra="""
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Logger keeping a random share of records at INFO or below
+    The decision is made before a record is created, so a skipped line costs
+    one random() call; warnings and errors always pass
+    """
+    def __init__(self, logger, rate):
+        super().__init__(logger, {})
+        self.rate = rate
+        self.sampled_out = 0
+
+    def log(self, level, msg, *args, **kwargs):
+        if level <= logging.INFO and self.rate < 1.0 and random.random() >= self.rate:
+            self.sampled_out += 1
+            return
+        super().log(level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        # Keep the caller's extra= fields (the base class replaces them)
+        return msg, kwargs
+
+
+class DrainingQueueListener(QueueListener):
+    """Queue listener whose stop() waits for room instead of failing on a full queue"""
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that never waits on a full queue and formats nothing itself
+    The listener thread does not survive a fork, so a forked child (a gunicorn
+    worker) starts its own queue and listener on its first record
+    """
+    def __init__(self, handlers, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._lock_start = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self._start_listener()
+
+    def _start_listener(self):
+        if self._listener_pid is not None:
+            # Records queued before the fork belong to the parent
+            self.queue = queue.Queue(self.maxsize)
+        self._listener = DrainingQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self._listener.start()
+        self._listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # Formatting (message interpolation, exceptions) happens on the listener
+        # thread; records stay in this process, so they do not need to be pickled
+        return record
+
+    def enqueue(self, record):
+        if self._listener_pid != os.getpid():
+            with self._lock_start:
+                if self._listener_pid != os.getpid():
+                    self._start_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Write out every queued record and stop the listener thread"""
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+
+
+# Installed handler and the sampled per-request loggers, for metrics
+_queue_handler = None
+_request_loggers = {}
+
+
+def get_request_logger(name):
+    """Logger for high-volume per-request lines; its INFO records are sampled"""
+    logger = _request_loggers.get(name)
+    if logger is None:
+        logger = _request_loggers.setdefault(
+            name, SampledLogger(logging.getLogger(f"{name}.requests"), LOG_REQUEST_SAMPLE_RATE)
+        )
+    return logger
+
+
+def configure_logging():
+    """
+    Route the root logger through the non-blocking queue handler
+    Safe to call more than once; returns the queue handler
+    """
+    global _queue_handler
+
+    if _queue_handler is not None:
+        return _queue_handler
+
+    if LOG_FILE:
+        output = logging.FileHandler(LOG_FILE)
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _queue_handler = NonBlockingQueueHandler([output])
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_queue_handler)
+    atexit.register(_queue_handler.stop)
+    return _queue_handler
+
+
+def logging_stats():
+    """Return queue depth, dropped and sampled-out record counts"""
+    if _queue_handler is None:
+        return None
+    return {
+        "queue_depth": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "sampled_out": sum(logger.sampled_out for logger in _request_loggers.values())
+    }
@@ -0,0 +1,364 @@
+"""
+SafeGuard Content Filter - Metrics Module
+Thread-safe counters, gauges and latency histograms rendered in the Prometheus
+text exposition format for the /metrics endpoint.
+Metrics are kept per process and every series carries a worker label (the
+process id). With METRICS_DIR set (gunicorn.conf.py sets it), each worker also
+writes its series to that directory every METRICS_FLUSH_INTERVAL seconds, so
+whichever worker answers a scrape reports every worker. Aggregate over the
+label, e.g. sum without (worker) (rate(safeguard_http_requests_total[5m]))
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Directory shared by the worker processes of one server, and how often each
+# worker writes its series there (other workers' series lag by up to this much)
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Latency buckets in seconds, from sub-millisecond keyword passes to slow upstreams
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Metric:
+    """Base class: a named metric family with a fixed list of label names"""
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {label_values}"
+            )
+        return tuple(str(value) for value in label_values)
+
+    def _labels(self, key):
+        return list(zip(self.labelnames, key))
+
+    def samples(self):
+        """Return (suffix, labels, value) tuples for the exposition format"""
+        with self._lock:
+            return [("", self._labels(key), value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down, such as requests in flight"""
+    kind = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets, with sum and count"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        key = self._key(label_values)
+        # Index of the first bucket whose upper bound holds the value (len = +Inf only)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        """Observe the wall-clock duration of the block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            series_items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in series_items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", labels + [("le", _format_value(float(bound)))], cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Metrics owned by this module plus collectors called at scrape time
+    A collector returns (name, kind, documentation, [(labels dict, value), ...])
+    tuples, for values that already live elsewhere (cache counters, queue depths)
+    """
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._writer_pid = None
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self):
+        """
+        Return this process's families as (name, kind, documentation, samples),
+        each sample a (sample name, labels, value) tuple with the worker label
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        worker = [("worker", str(os.getpid()))]
+        families = []
+        for metric in metrics:
+            families.append((metric.name, metric.kind, metric.documentation, [
+                (metric.name + suffix, worker + labels, value)
+                for suffix, labels, value in metric.samples()
+            ]))
+
+        for collector in collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                print(f"Metrics collector error: {str(e)}")
+                continue
+            for name, kind, documentation, samples in collected:
+                families.append((name, kind, documentation, [
+                    (name, worker + sorted(labels.items()), value) for labels, value in samples
+                ]))
+        return families
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def write_snapshot(self):
+        """Write this process's families to the shared directory"""
+        path = self._snapshot_path(os.getpid())
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.collect(), f)
+        os.replace(temp_path, path)
+
+    def remove_snapshot(self, pid):
+        """Forget the series of a worker that has exited"""
+        try:
+            os.remove(self._snapshot_path(pid))
+        except OSError:
+            pass
+
+    def _read_snapshots(self):
+        """Families written by the other workers"""
+        own = os.path.basename(self._snapshot_path(os.getpid()))
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name == own or not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.extend(json.load(f))
+            except (OSError, ValueError):
+                # The worker exited, or its file is being replaced
+                continue
+        return snapshots
+
+    def start_snapshot_writer(self, interval=METRICS_FLUSH_INTERVAL):
+        """Write snapshots from a background thread; once per process, no-op without a directory"""
+        if not self.directory or self._writer_pid == os.getpid():
+            return
+        self._writer_pid = os.getpid()
+
+        def write_forever():
+            while True:
+                try:
+                    self.write_snapshot()
+                except (OSError, TypeError, ValueError) as e:
+                    print(f"Metrics snapshot error: {str(e)}")
+                time.sleep(interval)
+
+        threading.Thread(target=write_forever, name="metrics-writer", daemon=True).start()
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        families = self.collect()
+        if self.directory:
+            families += self._read_snapshots()
+
+        # A family's lines must be contiguous, whichever workers reported it
+        merged = {}
+        for name, kind, documentation, samples in families:
+            family = merged.setdefault(name, (kind, documentation, []))
+            family[2].extend(samples)
+
+        lines = []
+        for name, (kind, documentation, samples) in merged.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Content type of the text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP endpoints
+REQUESTS = REGISTRY.register(Counter(
+    "safeguard_http_requests_total", "Requests handled, by endpoint, method and status",
+    ("endpoint", "method", "status")
+))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "safeguard_http_request_duration_seconds", "Request latency by endpoint",
+    ("endpoint",)
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "safeguard_http_requests_in_flight", "Requests currently being handled, by endpoint",
+    ("endpoint",)
+))
+
+# Pipeline stages (json_parse, keyword_pass, bert, image_fetch, decode,
+# pixel_analysis, inference, detection_api)
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "safeguard_stage_duration_seconds", "Time spent in each analysis stage",
+    ("stage",)
+))
+
+# Outbound calls and degraded paths
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    "safeguard_upstream_errors_total",
+    "Failed outbound calls, by upstream and reason (circuit_open, host_busy, connection, status_5xx)",
+    ("upstream", "reason")
+))
+FALLBACKS = REGISTRY.register(Counter(
+    "safeguard_fallbacks_total",
+    "Analyses answered by a fallback path, by component and reason",
+    ("component", "reason")
+))
+
+
+def observe_stage(stage, seconds):
+    """Record the duration of one stage"""
+    STAGE_LATENCY.observe(seconds, stage)
+
+
+def stage_timer(stage):
+    """Context manager timing one stage"""
+    return STAGE_LATENCY.time(stage)
+
+
+def record_upstream_error(upstream, reason):
+    UPSTREAM_ERRORS.inc(upstream, reason)
+
+
+def record_fallback(component, reason):
+    FALLBACKS.inc(component, reason)
+
+
+def add_collector(collector):
+    REGISTRY.add_collector(collector)
+
+
+def cache_collector(caches):
+    """
+    Collector exporting hit/miss counters for named caches
+    caches maps a cache name to a function returning its stats() dictionary,
+    or None while the cache does not exist yet
+    """
+    def collect():
+        stats = {name: get_stats() for name, get_stats in caches.items()}
+        stats = {name: cache_stats for name, cache_stats in stats.items() if cache_stats is not None}
+        families = [
+            ("safeguard_cache_hits_total", "counter", "Cache hits", "hits"),
+            ("safeguard_cache_misses_total", "counter", "Cache misses", "misses"),
+            ("safeguard_cache_evictions_total", "counter", "Entries evicted to respect the size bound", "evictions"),
+            ("safeguard_cache_entries", "gauge", "Entries currently cached", "size"),
+            ("safeguard_cache_hit_ratio", "gauge", "Hits divided by lookups since start", "hit_rate"),
+        ]
+        return [
+            (name, kind, documentation, [
+                ({"cache": cache}, cache_stats[field])
+                for cache, cache_stats in stats.items() if field in cache_stats
+            ])
+            for name, kind, documentation, field in families
+        ]
+    return collect
+
+
+def render():
+    return REGISTRY.render()
+
+
+def start_snapshot_writer():
+    """Start sharing this worker's series through METRICS_DIR (call after the fork)"""
+    REGISTRY.start_snapshot_writer()
+
+
+def remove_worker_snapshot(pid):
+    REGISTRY.remove_snapshot(pid)
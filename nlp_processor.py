@@ -3,122 +3,154 @@ SafeGuard Content Filter - NLP Text Analysis Module
 Provides BERT-based analysis for text content to detect harmful intent
 """
 import os
-import re
-import requests
 import json
 from collections import Counter
 from dotenv import load_dotenv
 
+from metrics import record_fallback
+from pattern_matcher import harmful_patterns, get_pattern_matcher, categorize_keywords
+from text_classifier import get_local_classifier, predict_negative_scores
+
 load_dotenv()  
 
 # Get API key from environment
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 
 # BERT model endpoint - using Hugging Face Inference API
+# Set BERT_BACKEND=local to score with an in-process ONNX model instead (see text_classifier.py)
 BERT_API_ENDPOINT = os.getenv("BERT-API", "")
 
-# Harmful content patterns for keyword detection
-harmful_patterns = {
-    "nsfw": [
-        "porn", "xxx", "nudity", "naked", "sex video", "adult content",
-        "pornography", "erotic", "nsfw", "explicit", "onlyfans"
-    ],
-    "violence": [
-        "violence", "gore", "blood", "kill", "murder", "dead body",
-        "graphic violence", "brutal", "fight video", "torture", "death"
-    ],
-    "suicide": [
-        "suicide", "kill myself", "self-harm", "how to die", "end my life",
-        "suicide methods", "hanging myself", "painless suicide"
-    ]
-}
-
 def analyze_text_with_bert(text):
     """
     Analyze text using BERT-based model for sentiment/intent analysis
     Returns a dictionary with harmful_probability and detected_keywords
     """
+    return analyze_texts_with_bert([text])[0]
+
+def analyze_texts_with_bert(texts):
+    """
+    Analyze several texts with a single BERT model call
+    Returns one result dictionary per text, in the same order
+    """
+    return score_texts_with_bert(texts)[0]
+
+def score_texts_with_bert(texts):
+    """
+    analyze_texts_with_bert that also reports whether a configured model failed
+    Returns (results, model_failed); when model_failed is True the results come
+    from the keyword fallback standing in for the model, so callers should not
+    keep them for long
+    """
     # First do keyword detection
-    keywords = detect_harmful_keywords(text)
+    keywords_list = [detect_harmful_keywords(text) for text in texts]
     
-    # If we have an API key, use the BERT model for advanced analysis
-    if HUGGINGFACE_API_KEY:
+    # Score with the local model when configured, otherwise with the remote API
+    negative_scores = None
+    fallback_reason = "not_configured"
+    if get_local_classifier() is not None and texts:
+        fallback_reason = "local_error"
         try:
-            # Prepare headers with API key
-            headers = {
-                "Authorization": f"Bearer {HUGGINGFACE_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            # Limit text length for API call
-            truncated_text = text[:512] if len(text) > 512 else text
-            
-            # Send request to Hugging Face API
-            response = requests.post(
-                BERT_API_ENDPOINT,
-                headers=headers,
-                json={"inputs": truncated_text}
-            )
-            
-            if response.status_code == 200:
-                predictions = response.json()
-                
-                # The model returns sentiment scores, but we can use them to detect harmful content
-                # Lower sentiment (negative) often correlates with harmful content
-                # Extract the negative sentiment score
-                negative_score = 0
-                
-                # Adapt to different response formats
-                if isinstance(predictions, list) and len(predictions) > 0:
-                    # Format: [{"label": "NEGATIVE", "score": 0.9}, {"label": "POSITIVE", "score": 0.1}]
-                    for pred in predictions[0]:
-                        if pred["label"] == "NEGATIVE":
-                            negative_score = pred["score"]
-                            break
-                elif isinstance(predictions, dict):
-                    # Format: {"sequence": "text", "labels": ["NEGATIVE", "POSITIVE"], "scores": [0.9, 0.1]}
-                    if "labels" in predictions and "scores" in predictions:
-                        for i, label in enumerate(predictions["labels"]):
-                            if label == "NEGATIVE":
-                                negative_score = predictions["scores"][i]
-                                break
-                
-                # Adjust harmful probability based on keyword matches
-                keyword_factor = min(1.0, len(keywords) * 0.2)  # Each keyword adds 0.2 up to 1.0
-                harmful_probability = max(negative_score, keyword_factor)
-                
-                # Return results
-                return {
-                    "harmful_probability": harmful_probability,
-                    "detected_keywords": keywords
-                }
-            else:
-                # API call failed, fall back to keyword matching
-                return fallback_analysis(text, keywords)
-                
+            # Concurrent requests share forward passes through the micro-batcher
+            negative_scores = predict_negative_scores(texts)
         except Exception as e:
-            print(f"BERT analysis error: {str(e)}")
-            # Fall back to keyword matching on error
-            return fallback_analysis(text, keywords)
-    else:
-        # No API key, use fallback keyword analysis
-        return fallback_analysis(text, keywords)
+            print(f"Local BERT analysis error: {str(e)}")
+    elif HUGGINGFACE_API_KEY and texts:
+        fallback_reason = "api_error"
+        negative_scores = remote_negative_scores(texts)
+    
+    if negative_scores is None:
+        # No model available or the call failed, use fallback keyword analysis
+        if texts:
+            record_fallback("bert", fallback_reason)
+        return [
+            fallback_analysis(text, keywords)
+            for text, keywords in zip(texts, keywords_list)
+        ], fallback_reason != "not_configured"
+    
+    results = []
+    for negative_score, keywords in zip(negative_scores, keywords_list):
+        # Adjust harmful probability based on keyword matches
+        keyword_factor = min(1.0, len(keywords) * 0.2)  # Each keyword adds 0.2 up to 1.0
+        harmful_probability = max(negative_score, keyword_factor)
+        
+        results.append({
+            "harmful_probability": harmful_probability,
+            "detected_keywords": keywords
+        })
+    return results, False
+
+def remote_negative_scores(texts):
+    """
+    Score texts with the Hugging Face Inference API
+    Returns the NEGATIVE score for each text, or None if the call failed
+    """
+    # Imported on first use: nodes scoring locally never load requests/urllib3
+    import http_client
+    try:
+        # Prepare headers with API key
+        headers = {
+            "Authorization": f"Bearer {HUGGINGFACE_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        
+        # Limit text length for API call
+        truncated_texts = [text[:512] for text in texts]
+        inputs = truncated_texts[0] if len(truncated_texts) == 1 else truncated_texts
+        
+        # Send request to Hugging Face API through the shared pooled client
+        response = http_client.post(
+            BERT_API_ENDPOINT,
+            headers=headers,
+            json={"inputs": inputs},
+            upstream="bert_api"
+        )
+        
+        if response.status_code != 200:
+            # API call failed, caller falls back to keyword matching
+            return None
+        
+        predictions = response.json()
+        
+        # A single zero-shot style answer comes back as a bare dictionary
+        if isinstance(predictions, dict):
+            predictions = [predictions]
+        
+        return [extract_negative_score(predictions[index]) for index in range(len(texts))]
+        
+    except Exception as e:
+        print(f"BERT analysis error: {str(e)}")
+        return None
+
+def extract_negative_score(prediction):
+    """
+    Extract the NEGATIVE sentiment score from the model output for one input
+    The model returns sentiment scores, but we can use them to detect harmful content:
+    lower sentiment (negative) often correlates with harmful content
+    """
+    # Adapt to different response formats
+    if isinstance(prediction, list):
+        # Format: [{"label": "NEGATIVE", "score": 0.9}, {"label": "POSITIVE", "score": 0.1}]
+        for pred in prediction:
+            if pred["label"] == "NEGATIVE":
+                return pred["score"]
+    elif isinstance(prediction, dict):
+        # Format: {"sequence": "text", "labels": ["NEGATIVE", "POSITIVE"], "scores": [0.9, 0.1]}
+        if "labels" in prediction and "scores" in prediction:
+            for i, label in enumerate(prediction["labels"]):
+                if label == "NEGATIVE":
+                    return prediction["scores"][i]
+    return 0
 
 def detect_harmful_keywords(text):
     """
     Detect harmful keywords in text
     Returns a list of detected keywords
     """
-    text = text.lower()
+    # Single word-boundary-aware pass over all harmful categories
+    hits = get_pattern_matcher().match(text, list(harmful_patterns), word_boundary=True)
     detected_keywords = []
-    
-    # Check for harmful patterns in each category
-    for category, patterns in harmful_patterns.items():
-        for pattern in patterns:
-            # Use word boundary matching to find whole words/phrases
-            matches = re.findall(r'\b' + re.escape(pattern) + r'\b', text)
-            if matches:
-                detected_keywords.extend(matches)
+    for patterns in hits.values():
+        detected_keywords.extend(patterns)
     
     # Return unique keywords
     return list(set(detected_keywords))
@@ -203,27 +235,7 @@ def get_category_from_keywords(keywords):
     Determine the primary category of harmful content based on keywords
     Returns the category with the most matches
     """
-    if not keywords:
-        return "none"
-    
-    category_counts = {
-        "nsfw": 0,
-        "violence": 0,
-        "suicide": 0
-    }
-    
-    # Count keywords in each category
-    for keyword in keywords:
-        for category, patterns in harmful_patterns.items():
-            if keyword in patterns:
-                category_counts[category] += 1
-    
-    # Find category with most matches
-    max_category = max(category_counts.items(), key=lambda x: x[1])
-    if max_category[1] == 0:
-        return "none"
-    
-    return max_category[0]
+    return categorize_keywords(keywords)
 
 # For testing
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+"""
+SafeGuard Content Filter - Local Object Detector Module
+Runs a YOLO-style object detection model in-process with ONNX Runtime on CPU,
+so image scanning does not depend on the remote detection API
+"""
+import os
+import ast
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Which backend detects objects: "remote" (detection API) or "local" (ONNX)
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "remote").lower()
+
+# Optional dependencies for local inference, only imported for the local backend
+ONNX_AVAILABLE = False
+if YOLO_BACKEND == "local":
+    try:
+        import numpy as np
+        import cv2
+        import onnxruntime as ort
+        ONNX_AVAILABLE = True
+    except ImportError:
+        pass
+
+# Exported YOLOv5/YOLOv8 detection model and optional class names file (one per line)
+YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "")
+YOLO_LABELS_PATH = os.getenv("YOLO_LABELS_PATH", "")
+
+# Inference settings; models with a fixed input shape override YOLO_INPUT_SIZE
+YOLO_INPUT_SIZE = int(os.getenv("YOLO_INPUT_SIZE", "640"))
+YOLO_NUM_THREADS = int(os.getenv("YOLO_NUM_THREADS", "1"))
+YOLO_CONF_THRESHOLD = float(os.getenv("YOLO_CONF_THRESHOLD", "0.25"))
+YOLO_IOU_THRESHOLD = float(os.getenv("YOLO_IOU_THRESHOLD", "0.45"))
+
+# Images per forward pass; larger batches are split to bound input tensor memory
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "8"))
+
+# Extra model class names treated as NSFW (comma separated), for models whose
+# labels are not in the built-in category lists
+YOLO_NSFW_LABELS = [
+    label.strip().lower() for label in os.getenv("YOLO_NSFW_LABELS", "").split(",") if label.strip()
+]
+
+
+def load_labels(session, labels_path=""):
+    """
+    Class names from a labels file, or from the "names" metadata that
+    Ultralytics writes into exported models; returns an empty list if neither exists
+    """
+    if labels_path:
+        with open(labels_path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    names = session.get_modelmeta().custom_metadata_map.get("names")
+    if names:
+        try:
+            parsed = ast.literal_eval(names)
+        except (ValueError, SyntaxError):
+            return []
+        if isinstance(parsed, dict):
+            return [str(parsed[index]) for index in sorted(parsed)]
+        return [str(name) for name in parsed]
+    return []
+
+
+class LocalObjectDetector:
+    """
+    ONNX Runtime YOLO detector
+    Letterboxes decoded images to the model input size, runs them through the
+    model and returns the classes found in each image with their confidence
+    """
+    def __init__(self, model_path, labels_path="", input_size=640, num_threads=1,
+                 conf_threshold=0.25, iou_threshold=0.45, batch_size=8):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+
+        # Static input dimensions win over the configured size
+        batch, _, height, width = model_input.shape
+        if isinstance(height, int) and isinstance(width, int):
+            if (height, width) != (input_size, input_size):
+                print(f"Object detector model expects {width}x{height} input; "
+                      f"ignoring YOLO_INPUT_SIZE={input_size}")
+            self.input_height, self.input_width = height, width
+        else:
+            self.input_height = self.input_width = input_size
+        # Fixed-batch exports can only run their exported batch size
+        self.fixed_batch = isinstance(batch, int)
+        self.batch_size = batch if self.fixed_batch else max(1, batch_size)
+
+        self.labels = load_labels(self.session, labels_path)
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    def detect(self, images):
+        """
+        Run detection over decoded BGR images
+        Returns one list of {"class", "confidence"} dictionaries per image
+        """
+        if not images:
+            return []
+
+        detections = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = [self._preprocess(image) for image in images[start:start + self.batch_size]]
+            count = len(chunk)
+            if self.fixed_batch:
+                chunk += [np.zeros_like(chunk[0])] * (self.batch_size - count)
+            outputs = self.session.run(None, {self.input_name: np.stack(chunk)})[0]
+            detections.extend(self._postprocess(output) for output in outputs[:count])
+        return detections
+
+    def _preprocess(self, image):
+        """Letterbox into the model input size and convert to normalized RGB CHW"""
+        height, width = image.shape[:2]
+        scale = min(self.input_width / width, self.input_height / height)
+        resized_width = max(1, round(width * scale))
+        resized_height = max(1, round(height * scale))
+        resized = cv2.resize(image, (resized_width, resized_height), interpolation=cv2.INTER_AREA)
+
+        canvas = np.full((self.input_height, self.input_width, 3), 114, dtype=np.uint8)
+        top = (self.input_height - resized_height) // 2
+        left = (self.input_width - resized_width) // 2
+        canvas[top:top + resized_height, left:left + resized_width] = resized
+
+        rgb = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB)
+        return rgb.transpose(2, 0, 1).astype(np.float32) / 255.0
+
+    def _postprocess(self, output):
+        """
+        Turn one image's raw predictions into detections
+        YOLOv5 exports rows of (cx, cy, w, h, objectness, class scores...);
+        YOLOv8 exports the transposed layout without objectness
+        """
+        classes = len(self.labels)
+        if (classes and output.shape[0] == classes + 4) or (
+            not classes and output.shape[0] < output.shape[1]
+        ):
+            output = output.T
+            boxes = output[:, :4]
+            class_scores = output[:, 4:]
+        else:
+            boxes = output[:, :4]
+            class_scores = output[:, 5:] * output[:, 4:5]
+
+        if class_scores.shape[1] == 0:
+            return []
+
+        class_ids = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(class_ids)), class_ids]
+        keep = confidences >= self.conf_threshold
+        if not keep.any():
+            return []
+
+        boxes, class_ids, confidences = boxes[keep], class_ids[keep], confidences[keep]
+        # Center format to top-left format for NMS
+        rects = np.column_stack([boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2,
+                                 boxes[:, 2], boxes[:, 3]])
+        indices = cv2.dnn.NMSBoxesBatched(
+            rects.tolist(), confidences.tolist(), class_ids.tolist(),
+            self.conf_threshold, self.iou_threshold
+        )
+
+        return [
+            {
+                "class": self._label(int(class_ids[index])),
+                "confidence": float(confidences[index])
+            }
+            for index in np.array(indices).flatten()
+        ]
+
+    def _label(self, class_id):
+        if class_id < len(self.labels):
+            return self.labels[class_id]
+        return f"class_{class_id}"
+
+
+# Shared detector, loaded once per process
+_detector = None
+_detector_lock = threading.Lock()
+_detector_failed = False
+_detector_pid = None
+
+
+def get_local_detector():
+    """
+    Return the shared local detector, loading it on first use
+    Returns None when the local backend is not configured or cannot be loaded
+    """
+    global _detector, _detector_failed, _detector_pid
+
+    if _detector is not None and _detector_pid != os.getpid() and YOLO_NUM_THREADS > 1:
+        # Same fork rule as the text classifier: only single-threaded sessions are
+        # shared with the parent, multi-threaded ones are loaded again
+        with _detector_lock:
+            if _detector_pid != os.getpid():
+                _detector = None
+
+    if _detector is not None or _detector_failed:
+        return _detector
+    if YOLO_BACKEND != "local":
+        return None
+
+    with _detector_lock:
+        if _detector is None and not _detector_failed:
+            if not ONNX_AVAILABLE:
+                print("Local YOLO backend requested but onnxruntime/opencv are not installed")
+                _detector_failed = True
+            elif not YOLO_MODEL_PATH:
+                print("Local YOLO backend requested but YOLO_MODEL_PATH is not set")
+                _detector_failed = True
+            else:
+                try:
+                    _detector = LocalObjectDetector(
+                        YOLO_MODEL_PATH,
+                        YOLO_LABELS_PATH,
+                        input_size=YOLO_INPUT_SIZE,
+                        num_threads=YOLO_NUM_THREADS,
+                        conf_threshold=YOLO_CONF_THRESHOLD,
+                        iou_threshold=YOLO_IOU_THRESHOLD,
+                        batch_size=YOLO_BATCH_SIZE
+                    )
+                    _detector_pid = os.getpid()
+                except Exception as e:
+                    print(f"Failed to load local YOLO model: {str(e)}")
+                    _detector_failed = True
+
+    return _detector
@@ -0,0 +1,419 @@
+"""
+SafeGuard Content Filter - Pattern Matching Module
+Provides the shared harmful/educational pattern lists and a precompiled
+Aho-Corasick automaton that finds every keyword in a single pass over the text
+"""
+import zlib
+import hashlib
+import threading
+from collections import deque
+
+# Harmful content patterns for keyword detection
+harmful_patterns = {
+    "nsfw": [
+        "porn", "xxx", "nudity", "naked", "sex video", "adult content",
+        "pornography", "erotic", "nsfw", "explicit", "onlyfans"
+    ],
+    "violence": [
+        "violence", "gore", "blood", "kill", "murder", "dead body",
+        "graphic violence", "brutal", "fight video", "torture", "death"
+    ],
+    "suicide": [
+        "suicide", "kill myself", "self-harm", "how to die", "end my life",
+        "suicide methods", "hanging myself", "painless suicide"
+    ]
+}
+
+# Educational context indicators
+educational_terms = [
+    # General education terms
+    "education", "research", "study", "information", "learn", "article", 
+    "report", "news", "medical", "health", "science", "history", "academic",
+    
+    # Additional academic and research terms
+    "effects", "impact", "paper", "case study", "studies", "statistics",
+    "psychological", "analysis", "assessment", "correlation", "comparison",
+    "theory", "evidence", "data", "findings", "review", "journal", "bibliography"
+    
+    # Subject-specific educational terms
+    "neurological", "psychology", "therapy", "counseling", "prevention", 
+    "awareness", "treatment", "mental health", "strategies", "recovery",
+    "behavior", "cognitive", "development", "intervention", "methodology",
+    
+    # Educational roles and institutions
+    "school", "university", "college", "classroom", "teacher", "student", 
+    "professor", "counselor", "program", "curriculum", "dissertation", "thesis",
+    
+    # Paper and document types
+    "literature", "publication", "dissertation", "thesis", "journal", 
+    "proceedings", "textbook", "encyclopedia", "bibliography", "citation","theory","theories"
+]
+
+# Educational terms that count double towards the educational score
+strong_educational_terms = {
+    "research", "study", "paper", "academic", "psychology",
+    "education", "prevention", "awareness", "effects", "impact"
+}
+
+# Category name used for educational terms inside the pattern matcher
+EDUCATIONAL_CATEGORY = "educational"
+
+# Content blocks: a block is cut after a line whose checksum has the mask bits
+# clear, once it holds at least BLOCK_MIN_CHARS, and always at BLOCK_MAX_CHARS
+# (blocks are whole lines, so a single longer line still forms one block)
+BLOCK_MIN_CHARS = 256
+BLOCK_MAX_CHARS = 2048
+BLOCK_CUT_MASK = 3
+
+
+def _is_word_char(char):
+    """Same definition of a word character as the regex \\w class"""
+    return char.isalnum() or char == "_"
+
+
+class PatternMatcher:
+    """
+    Multi-pattern matcher built once from a mapping of category -> patterns
+    Scanning cost depends on the text length, not on the number of patterns.
+    Each pattern's categories and weight are looked up once at build time, so
+    every hit comes back already classified
+    """
+    def __init__(self, patterns_by_category, weights=None):
+        self.categories = list(patterns_by_category.keys())
+        weights = weights or {}
+
+        # Trie transitions, failure links and per-state outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        # Categories each pattern belongs to (a pattern may appear in several)
+        self._pattern_categories = {}
+
+        for category, patterns in patterns_by_category.items():
+            for pattern in patterns:
+                pattern = pattern.lower()
+                if not pattern:
+                    continue
+                categories = self._pattern_categories.setdefault(pattern, [])
+                if category not in categories:
+                    categories.append(category)
+                self._add_pattern(pattern)
+
+        self._build_failure_links()
+
+        # Pattern -> (categories, weight) lookup table for hits
+        self.pattern_info = {
+            pattern: (tuple(categories), weights.get(pattern, 1))
+            for pattern, categories in self._pattern_categories.items()
+        }
+
+    def _add_pattern(self, pattern):
+        """Insert a pattern into the trie"""
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        if pattern not in self._output[state]:
+            self._output[state].append(pattern)
+
+    def _build_failure_links(self):
+        """Breadth-first construction of failure links and merged outputs"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # Patterns ending at the failure state also end here
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def iter_matches(self, text, word_boundary=False):
+        """
+        Yield (start, end, pattern) for every occurrence of every pattern
+        The text is expected to be lowercased already; with word_boundary only
+        occurrences that a regex \\bpattern\\b would find are reported
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = index + 1
+                for pattern in output[state]:
+                    start = end - len(pattern)
+                    if word_boundary and not self._on_boundaries(text, start, end, pattern):
+                        continue
+                    yield start, end, pattern
+
+    @staticmethod
+    def _on_boundaries(text, start, end, pattern):
+        """Check the \\b assertions on both sides of a match"""
+        before = start > 0 and _is_word_char(text[start - 1])
+        after = end < len(text) and _is_word_char(text[end])
+        return (
+            before != _is_word_char(pattern[0]) and
+            after != _is_word_char(pattern[-1])
+        )
+
+    def iter_hits(self, text, categories=None, word_boundary=False):
+        """
+        Yield (pattern, categories, weight) once per distinct pattern found in text,
+        in order of first appearance; only patterns in the requested categories
+        are reported when given
+        """
+        wanted = None if categories is None else set(categories)
+        seen = set()
+
+        for _, _, pattern in self.iter_matches(text.lower(), word_boundary):
+            if pattern in seen:
+                continue
+            seen.add(pattern)
+            pattern_categories, weight = self.pattern_info[pattern]
+            if wanted is None or not wanted.isdisjoint(pattern_categories):
+                yield pattern, pattern_categories, weight
+
+    def match(self, text, categories=None, word_boundary=False):
+        """
+        Find all patterns present in text
+        Returns a dictionary of category -> unique matched patterns, in order of first
+        appearance; only the requested categories are reported when given
+        """
+        wanted = self.categories if categories is None else [
+            category for category in categories if category in self.categories
+        ]
+        results = {category: [] for category in wanted}
+
+        for pattern, pattern_categories, _ in self.iter_hits(text, wanted, word_boundary):
+            for category in pattern_categories:
+                if category in results:
+                    results[category].append(pattern)
+
+        return results
+
+
+def build_pattern_matcher():
+    """
+    Compile harmful patterns and educational terms into a single matcher
+    Strong educational terms are weighted 2, every other pattern 1
+    """
+    patterns_by_category = dict(harmful_patterns)
+    patterns_by_category[EDUCATIONAL_CATEGORY] = educational_terms
+    weights = {term: 2 for term in strong_educational_terms}
+    return PatternMatcher(patterns_by_category, weights)
+
+
+# Shared matcher, built once at import and rebuilt by update_patterns()
+_matcher = build_pattern_matcher()
+_matcher_lock = threading.Lock()
+
+# Callbacks run after the pattern lists change (e.g. to drop cached verdicts)
+_update_listeners = []
+
+
+def get_pattern_matcher():
+    """Return the current shared matcher"""
+    return _matcher
+
+
+def add_update_listener(callback):
+    """Register a callback to run whenever the pattern lists change"""
+    _update_listeners.append(callback)
+
+
+def update_patterns(new_harmful_patterns=None, new_educational_terms=None):
+    """Replace the pattern lists, rebuild the shared matcher and notify listeners"""
+    global _matcher
+
+    with _matcher_lock:
+        if new_harmful_patterns is not None:
+            harmful_patterns.clear()
+            harmful_patterns.update(new_harmful_patterns)
+        if new_educational_terms is not None:
+            educational_terms[:] = new_educational_terms
+
+        _matcher = build_pattern_matcher()
+
+    for callback in _update_listeners:
+        callback()
+
+
+def match_patterns(text, filters, word_boundary=True):
+    """
+    Run a single matcher pass over text, scoring educational context as it goes
+    Returns (harmful keywords for the enabled filters, educational terms found,
+    educational score)
+    """
+    matched_keywords, educational_hits, educational_score, _ = scan_text(
+        text, filters, word_boundary
+    )
+    return matched_keywords, educational_hits, educational_score
+
+
+def iter_blocks(text, max_chars=BLOCK_MAX_CHARS):
+    """
+    Split text into content-defined blocks of whole lines
+    Past BLOCK_MIN_CHARS a block ends after a line whose checksum has the
+    BLOCK_CUT_MASK bits clear (about one line in four), or once it reaches max_chars.
+    Boundaries therefore depend only on nearby lines, and shared boilerplate
+    produces the same blocks on every page.
+    Yields (offset, block); the newline after a block belongs to neither block
+    """
+    length = len(text)
+    start = 0
+    block_start = 0
+    while start <= length:
+        end = text.find("\n", start)
+        if end < 0:
+            end = length
+        line = text[start:end]
+        size = end - block_start
+        if (end == length or size >= max_chars or (
+                size >= BLOCK_MIN_CHARS and
+                zlib.crc32(line.encode("utf-8", "surrogatepass")) & BLOCK_CUT_MASK == 0)):
+            yield block_start, text[block_start:end]
+            block_start = end + 1
+        start = end + 1
+
+
+def _summarize_matches(matcher, text, word_boundary):
+    """
+    Compact form of the occurrences in text: (first occurrence of each pattern,
+    later occurrences of harmful patterns), each a tuple of (start, pattern).
+    Repeats of educational-only terms are dropped, as nothing uses them
+    """
+    first_hits = []
+    repeat_hits = []
+    seen = set()
+    for start, _, pattern in matcher.iter_matches(text.lower(), word_boundary):
+        if pattern not in seen:
+            seen.add(pattern)
+            first_hits.append((start, pattern))
+        elif matcher.pattern_info[pattern][0] != (EDUCATIONAL_CATEGORY,):
+            repeat_hits.append((start, pattern))
+    return tuple(first_hits), tuple(repeat_hits)
+
+
+def _iter_block_matches(text, word_boundary, block_cache):
+    """
+    Yield (offset, first_hits, repeat_hits) for each block of text
+    Each block's summary is cached under a digest of the block, so a block seen
+    before (on this page or any other) is not scanned again. Patterns never
+    contain a newline, so no occurrence spans two blocks.
+    """
+    matcher = _matcher
+    flag = b"\x01" if word_boundary else b"\x00"
+    for offset, block in iter_blocks(text):
+        key = hashlib.blake2b(
+            block.encode("utf-8", "surrogatepass") + flag, digest_size=16
+        ).hexdigest()
+        summary = block_cache.get(key)
+        if summary is None:
+            summary = _summarize_matches(matcher, block, word_boundary)
+            block_cache.set(key, summary)
+        yield (offset,) + summary
+
+
+def scan_text(text, filters, word_boundary=True, should_stop=None, block_cache=None):
+    """
+    match_patterns for long text: also returns the start offset of every harmful
+    keyword occurrence, and can stop early
+    should_stop(keyword_count, educational_score) is called after each new distinct
+    hit; when it returns True the rest of the text is not scanned.
+    With a block_cache (any object with get/set, e.g. a TTLCache), text is
+    matched block by block and blocks seen before are not scanned again.
+    Returns (matched_keywords, educational_hits, educational_score, harmful_positions)
+    """
+    enabled = [filter_type for filter_type in filters if filter_type in harmful_patterns]
+    enabled_set = set(enabled)
+    matched_by_filter = {filter_type: [] for filter_type in enabled}
+    educational_hits = []
+    educational_score = 0
+    keyword_count = 0
+    harmful_positions = []
+    seen = set()
+    pattern_info = _matcher.pattern_info
+
+    if block_cache is None:
+        # One match at a time, so should_stop can end the scan early
+        blocks = (
+            (0, ((start, pattern),), ())
+            for start, _, pattern in _matcher.iter_matches(text.lower(), word_boundary)
+        )
+    else:
+        blocks = _iter_block_matches(text, word_boundary, block_cache)
+
+    stopped = False
+    for offset, first_hits, repeat_hits in blocks:
+        for start, pattern in first_hits:
+            info = pattern_info.get(pattern)
+            if info is None:
+                # Cached by a matcher that has since been rebuilt without this pattern
+                continue
+            categories, weight = info
+            is_harmful = not enabled_set.isdisjoint(categories)
+            if is_harmful:
+                harmful_positions.append(offset + start)
+            if pattern in seen:
+                continue
+            seen.add(pattern)
+
+            for category in categories:
+                if category == EDUCATIONAL_CATEGORY:
+                    educational_hits.append(pattern)
+                    educational_score += weight
+                elif category in matched_by_filter:
+                    matched_by_filter[category].append(pattern)
+                    keyword_count += 1
+
+            if should_stop is not None and (is_harmful or EDUCATIONAL_CATEGORY in categories):
+                if should_stop(keyword_count, educational_score):
+                    stopped = True
+                    break
+        if stopped:
+            break
+
+        for start, pattern in repeat_hits:
+            info = pattern_info.get(pattern)
+            if info is not None and not enabled_set.isdisjoint(info[0]):
+                harmful_positions.append(offset + start)
+
+    # Keywords are grouped by filter, in the order the filters were given
+    matched_keywords = []
+    for filter_type in filters:
+        matched_keywords.extend(matched_by_filter.get(filter_type, []))
+    return matched_keywords, educational_hits, educational_score, harmful_positions
+
+
+def categorize_keywords(keywords):
+    """
+    Primary harmful category of keywords: the category with the most matches
+    (earlier categories win ties), or "none" when no keyword is a known pattern
+    """
+    counts = dict.fromkeys(harmful_patterns, 0)
+    pattern_info = _matcher.pattern_info
+
+    for keyword in keywords:
+        for category in pattern_info.get(keyword, ((), 0))[0]:
+            if category in counts:
+                counts[category] += 1
+
+    category = max(counts, key=counts.get, default=None)
+    if category is None or counts[category] == 0:
+        return "none"
+    return category
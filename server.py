@@ -1,26 +1,88 @@
 
 
 import os
+import sys
+import time
+
+# Startup report: time spent importing, loading models and warming up
+STARTUP_STARTED = time.perf_counter()
+
 import json
+import base64
+import binascii
+import hashlib
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-import numpy as np
 from dotenv import load_dotenv
 
 
 load_dotenv()  
 
 # Import utilities for AI processing
-from nlp_processor import analyze_text_with_bert
-from vision_processor import analyze_image_with_yolo
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from nlp_processor import score_texts_with_bert
+from text_classifier import get_local_classifier, text_model_stats
+from pattern_matcher import (
+    match_patterns, scan_text, categorize_keywords, add_update_listener
 )
+from cache import TTLCache
+from domain_index import DomainBlocklist
+import metrics
+from metrics import stage_timer
+from logging_setup import configure_logging, get_request_logger, logging_stats
+
+# Set up logging: a writer thread does the formatting and I/O, and per-request
+# INFO lines go through a sampled logger
+configure_logging()
 logger = logging.getLogger(__name__)
+request_logger = get_request_logger(__name__)
+
+startup_timings = {"imports": time.perf_counter() - STARTUP_STARTED}
+
+# Models and the image analysis stack (OpenCV, numpy, aiohttp) load on the first
+# request that needs them, so text-only nodes start fast. WARMUP=true loads
+# everything at startup instead; IMAGE_WARMUP controls the image part on its own
+WARMUP = os.getenv("WARMUP", "false").lower() == "true"
+IMAGE_WARMUP = os.getenv("IMAGE_WARMUP", str(WARMUP)).lower() == "true"
+
+# Image worker processes re-import this module as __mp_main__; only the serving
+# process loads models and starts workers
+if __name__ != "__mp_main__":
+    if WARMUP:
+        # Load the local text classifier when BERT_BACKEND=local
+        started = time.perf_counter()
+        get_local_classifier()
+        startup_timings["text_model"] = time.perf_counter() - started
+
+    if IMAGE_WARMUP:
+        started = time.perf_counter()
+        from vision_processor import warm_up_image_analysis
+        startup_timings["image_imports"] = time.perf_counter() - started
+        startup_timings["image_warmup"] = warm_up_image_analysis()
+
+def loaded_upstream_stats():
+    """
+    Circuit breaker summary of the HTTP client, or an empty one before any
+    outbound call has loaded it (reporting must not import requests)
+    """
+    http_client = sys.modules.get("http_client")
+    if http_client is None:
+        return {"tracked_hosts": 0, "open_circuits": {}}
+    return http_client.breaker_stats()
+
+def loaded_image_stats():
+    """
+    Image cache, worker pool and pipeline stats, with None for any part this
+    process has not loaded yet (reporting must not import the image stack)
+    """
+    vision = sys.modules.get("vision_processor")
+    workers = sys.modules.get("image_workers")
+    pipeline = sys.modules.get("image_pipeline")
+    return {
+        "image_cache": vision.image_cache_stats() if vision else None,
+        "image_workers": workers.worker_pool_stats() if workers else None,
+        "image_pipeline": pipeline.image_pipeline_stats() if pipeline else None
+    }
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -29,46 +91,129 @@ CORS(app)  # Enable CORS for browser extension requests
 # Get API keys from environment variables
 API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 
-# Load harmful content patterns
-harmful_patterns = {
-    "nsfw": [
-        "porn", "xxx", "nudity", "naked", "sex video", "adult content",
-        "pornography", "erotic", "nsfw", "explicit", "onlyfans"
-    ],
-    "violence": [
-        "violence", "gore", "blood", "kill", "murder", "dead body",
-        "graphic violence", "brutal", "fight video", "torture", "death"
-    ],
-    "suicide": [
-        "suicide", "kill myself", "self-harm", "how to die", "end my life",
-        "suicide methods", "hanging myself", "painless suicide"
-    ]
-}
+# Maximum number of items accepted by /analyze_batch
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "100"))
 
-# Educational context indicators
-educational_terms = [
-    # General education terms
-    "education", "research", "study", "information", "learn", "article", 
-    "report", "news", "medical", "health", "science", "history", "academic",
-    
-    # Additional academic and research terms
-    "effects", "impact", "paper", "case study", "studies", "statistics",
-    "psychological", "analysis", "assessment", "correlation", "comparison",
-    "theory", "evidence", "data", "findings", "review", "journal", "bibliography"
-    
-    # Subject-specific educational terms
-    "neurological", "psychology", "therapy", "counseling", "prevention", 
-    "awareness", "treatment", "mental health", "strategies", "recovery",
-    "behavior", "cognitive", "development", "intervention", "methodology",
-    
-    # Educational roles and institutions
-    "school", "university", "college", "classroom", "teacher", "student", 
-    "professor", "counselor", "program", "curriculum", "dissertation", "thesis",
+# Run image downloads on the shared asyncio pipeline instead of the request thread
+IMAGE_ASYNC_PIPELINE = os.getenv("IMAGE_ASYNC_PIPELINE", "true").lower() == "true"
+
+# Long page content: characters scanned at most, characters per BERT window and
+# number of windows sent to BERT (the first window plus the most keyword-dense ones)
+CONTENT_MAX_CHARS = int(os.getenv("CONTENT_MAX_CHARS", "1000000"))
+CONTENT_WINDOW_CHARS = int(os.getenv("CONTENT_WINDOW_CHARS", "1000"))
+CONTENT_MAX_WINDOWS = int(os.getenv("CONTENT_MAX_WINDOWS", "4"))
+
+# Stop scanning page content as soon as the keyword verdict can no longer change.
+# The reported keywords and category then only cover the text scanned so far;
+# scans whose keyword positions pick the BERT windows always run to the end
+CONTENT_EARLY_STOP = os.getenv("CONTENT_EARLY_STOP", "true").lower() == "true"
+
+# Maximum number of images accepted by /analyze_images
+MAX_IMAGE_BATCH = int(os.getenv("MAX_IMAGE_BATCH", "64"))
+
+# Cache of finished verdicts for repeated queries, pages and domains
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "10000"))
+VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", "300"))
+# Verdicts answered by the keyword fallback after a BERT failure are kept only briefly
+VERDICT_FALLBACK_TTL = int(os.getenv("VERDICT_FALLBACK_TTL", "10"))
+verdict_cache = TTLCache(maxsize=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL)
+
+# Keyword hits per content block, so boilerplate shared between pages
+# (navigation, footers, syndicated text) is only scanned once
+BLOCK_CACHE_SIZE = int(os.getenv("BLOCK_CACHE_SIZE", "50000"))
+BLOCK_CACHE_TTL = int(os.getenv("BLOCK_CACHE_TTL", "3600"))
+block_cache = TTLCache(maxsize=BLOCK_CACHE_SIZE, ttl=BLOCK_CACHE_TTL)
+
+# Known harmful domains, loaded once at startup and hot-reloaded when the file changes
+domain_blocklist = DomainBlocklist()
+
+# Cached verdicts are stale as soon as the pattern lists or the blocklist change
+add_update_listener(verdict_cache.clear)
+add_update_listener(block_cache.clear)
+domain_blocklist.add_reload_listener(verdict_cache.clear)
+
+def collect_runtime_metrics():
+    """Scrape-time gauges for work queued or in flight outside the request threads"""
+    families = []
+    
+    scheduler = text_model_stats()["scheduler"]
+    if scheduler is not None:
+        families.append((
+            "safeguard_bert_queue_depth", "gauge",
+            "Texts waiting for the BERT micro-batcher",
+            [({}, scheduler["queue_depth"])]
+        ))
+    
+    pipeline = loaded_image_stats()["image_pipeline"]
+    if pipeline is not None:
+        families.append((
+            "safeguard_image_analyses_in_flight", "gauge",
+            "Image analyses running on the async pipeline",
+            [({}, pipeline["in_flight"])]
+        ))
+    
+    upstreams = loaded_upstream_stats()
+    families += [
+        ("safeguard_upstream_open_circuits", "gauge",
+         "Upstream hosts whose circuit breaker is open or half-open",
+         [({}, len(upstreams["open_circuits"]))]),
+        ("safeguard_upstream_tracked_hosts", "gauge",
+         "Upstream hosts with a circuit breaker kept in memory",
+         [({}, upstreams["tracked_hosts"])])
+    ]
     
-    # Paper and document types
-    "literature", "publication", "dissertation", "thesis", "journal", 
-    "proceedings", "textbook", "encyclopedia", "bibliography", "citation","theory","theories"
-]
+    families.append((
+        "safeguard_startup_seconds", "gauge",
+        "Time spent in each startup phase of this process",
+        [({"phase": phase}, seconds) for phase, seconds in startup_timings.items()]
+    ))
+    
+    log_stats = logging_stats()
+    families += [
+        ("safeguard_log_queue_depth", "gauge",
+         "Log records waiting for the writer thread", [({}, log_stats["queue_depth"])]),
+        ("safeguard_log_records_dropped_total", "counter",
+         "Log records dropped because the queue was full", [({}, log_stats["dropped"])]),
+        ("safeguard_log_records_sampled_out_total", "counter",
+         "Per-request log records skipped by sampling", [({}, log_stats["sampled_out"])])
+    ]
+    return families
+
+metrics.add_collector(metrics.cache_collector({
+    "verdict": verdict_cache.stats,
+    "block": block_cache.stats,
+    "image_url": lambda: (loaded_image_stats()["image_cache"] or {}).get("url"),
+    "image_content": lambda: (loaded_image_stats()["image_cache"] or {}).get("content")
+}))
+metrics.add_collector(collect_runtime_metrics)
+
+@app.before_request
+def start_request_metrics():
+    """Count the request as in flight and time JSON parsing as its own stage"""
+    # Route templates, not raw paths, so unknown URLs cannot create new series
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_started = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.inc(g.metrics_endpoint)
+    
+    if request.is_json:
+        # The parsed body is cached, so handlers reading request.json reuse it
+        # (invalid JSON is still rejected there)
+        with stage_timer("json_parse"):
+            request.get_json(silent=True)
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = g.get("metrics_endpoint")
+    if endpoint is not None:
+        metrics.REQUESTS.inc(endpoint, request.method, response.status_code)
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, endpoint)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    endpoint = g.pop("metrics_endpoint", None)
+    if endpoint is not None:
+        metrics.REQUESTS_IN_FLIGHT.dec(endpoint)
 
 @app.route('/', methods=['GET'])
 def index():
@@ -159,12 +304,24 @@ def index():
             <p>Check if a domain is known to host harmful content.</p>
         </div>
         
+        <div class="endpoint">
+            <h3>Analyze Batch</h3>
+            <p><code>POST /analyze_batch</code></p>
+            <p>Analyze a list of queries, page contents and domains in one request.</p>
+        </div>
+        
         <div class="endpoint">
             <h3>Analyze Image</h3>
             <p><code>POST /analyze_image</code></p>
             <p>Analyze an image for NSFW/harmful content using YOLO.</p>
         </div>
         
+        <div class="endpoint">
+            <h3>Analyze Images</h3>
+            <p><code>POST /analyze_images</code></p>
+            <p>Analyze a list of image URLs or inline base64 images in one request.</p>
+        </div>
+        
         <h2>How to Use</h2>
         <p>This server is designed to be used with the SafeGuard Content Filter browser extension. 
         It's not intended for direct browser access.</p>
@@ -184,7 +341,28 @@ def index():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "ok"})
+    health = {
+        "status": "ok",
+        "verdict_cache": verdict_cache.stats(),
+        "block_cache": block_cache.stats(),
+        **loaded_image_stats(),
+        "upstreams": loaded_upstream_stats(),
+        "blocked_domains": len(domain_blocklist),
+        "logging": logging_stats(),
+        "startup_seconds": startup_timings,
+        # Model status and micro-batching metrics; never loads the model
+        "text_model": text_model_stats()
+    }
+    
+    return jsonify(health)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus metrics, one series per worker process (worker label); under
+    gunicorn every worker's series are included, so sum over the label
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/test-all-filters', methods=['GET'])
 def test_all_filters():
@@ -230,77 +408,131 @@ def analyze_search_query():
     
     # Safely get data from the request
     data = request.json or {}
+    
+    result = analyze_items([("query", data)])[0]
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/analyze_content', methods=['POST'])
+def analyze_page_content():
+    """Analyze web page content for harmful material"""
+    # Check if request contains JSON data
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    
+    # Safely get data from the request
+    data = request.json or {}
+    
+    result = analyze_items([("content", data)])[0]
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/check_domain', methods=['POST'])
+def check_domain():
+    """Check if a domain is known to host harmful content"""
+    # Check if request contains JSON data
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    
+    # Safely get data from the request
+    data = request.json or {}
+    
+    result = analyze_items([("domain", data)])[0]
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """Analyze a mixed list of queries, page contents and domains in one request"""
+    # Check if request contains JSON data
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    items = data.get('items')
+    if not isinstance(items, list):
+        return jsonify({"error": "Request must contain a list of items"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"Batch is limited to {MAX_BATCH_ITEMS} items"}), 400
+    
+    # Top-level settings apply to every item unless the item overrides them
+    shared_settings = {
+        key: data[key] for key in ('sensitivity', 'educational_mode', 'filters')
+        if key in data
+    }
+    
+    valid_items = []
+    for item in items:
+        if isinstance(item, dict) and item.get('type') in BATCH_EVALUATORS:
+            item_data = dict(shared_settings)
+            item_data.update(item)
+            valid_items.append((item['type'], item_data))
+    
+    # One model call covers every item that still needs a BERT check
+    valid_results = iter(analyze_items(valid_items))
+    
+    return jsonify({
+        "results": [
+            next(valid_results)
+            if isinstance(item, dict) and item.get('type') in BATCH_EVALUATORS
+            else {"error": "Unknown item type"}
+            for item in items
+        ]
+    })
+
+def evaluate_query(data):
+    """
+    Keyword stage of search query analysis
+    Returns a verdict that may still carry a pending BERT check
+    """
     query = data.get('query', '')
     sensitivity = data.get('sensitivity', 'medium')
     educational_mode = data.get('educational_mode', True)
     filters = data.get('filters', ['nsfw', 'violence', 'suicide'])
     
-    logger.info(f"Analyzing search query: {query}")
+    request_logger.info("Analyzing search query: %s", query)
     
-    # Basic pattern matching
-    is_harmful = False
-    matched_keywords = []
-    
-    # Check each filter category
-    for filter_type in filters:
-        if filter_type in harmful_patterns:
-            patterns = harmful_patterns[filter_type]
-            for pattern in patterns:
-                if pattern in query.lower():
-                    is_harmful = True
-                    matched_keywords.append(pattern)
+    # Basic pattern matching (harmful and educational terms in one pass)
+    with stage_timer("keyword_pass"):
+        matched_keywords, _, educational_score = match_patterns(query, filters)
+    is_harmful = bool(matched_keywords)
     
     # If harmful and educational mode is on, check for educational context
     if is_harmful and educational_mode:
-        educational_score = 0
-        query_lower = query.lower()
-        
-        # Multiple word terms need special handling
-        for term in educational_terms:
-            if term in query_lower:
-                # Give higher score to stronger educational indicators
-                if term in ["research", "study", "paper", "academic", "psychology", 
-                           "education", "prevention", "awareness", "effects", "impact"]:
-                    educational_score += 2
-                else:
-                    educational_score += 1
-        
-        logger.info(f"Educational score for query '{query}': {educational_score}")
+        request_logger.info("Educational score for query '%s': %s", query, educational_score)
         
         # If educational context is detected, allow the content
         # Lower threshold for search queries since they're shorter
         if educational_score >= 1:
             is_harmful = False
-            logger.info(f"Educational context detected, allowing query")
+            request_logger.info("Educational context detected, allowing query")
+    
+    verdict = {
+        "type": "query",
+        "is_harmful": is_harmful,
+        "keywords": matched_keywords
+    }
     
     # Apply sensitivity adjustments
     if sensitivity == 'low' and len(matched_keywords) <= 1:
-        is_harmful = False
+        verdict["is_harmful"] = False
     elif sensitivity == 'high' and not is_harmful:
         # Use BERT for advanced analysis on high sensitivity
-        try:
-            bert_result = analyze_text_with_bert(query)
-            if bert_result['harmful_probability'] > 0.6:
-                is_harmful = True
-                matched_keywords.extend(bert_result.get('detected_keywords', []))
-        except Exception as e:
-            logger.error(f"BERT analysis error: {str(e)}")
+        verdict["bert_texts"] = [query]
+        verdict["bert_threshold"] = 0.6
     
-    return jsonify({
-        "is_harmful": is_harmful,
-        "harmful_keywords": list(set(matched_keywords)),
-        "category": determine_category(matched_keywords)
-    })
+    return verdict
 
-@app.route('/analyze_content', methods=['POST'])
-def analyze_page_content():
-    """Analyze web page content for harmful material"""
-    # Check if request contains JSON data
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
-    
-    # Safely get data from the request
-    data = request.json or {}
+def evaluate_content(data):
+    """
+    Keyword stage of page content analysis
+    Returns a verdict that may still carry a pending BERT check
+    """
     content = data.get('content', '')
     url = data.get('url', '')
     title = data.get('title', '')
@@ -308,135 +540,285 @@ def analyze_page_content():
     educational_mode = data.get('educational_mode', True)
     filters = data.get('filters', ['nsfw', 'violence', 'suicide'])
     
-    logger.info(f"Analyzing content from URL: {url}")
+    request_logger.info("Analyzing content from URL: %s", url)
     
-    # Basic keyword detection
-    is_harmful = False
-    matched_keywords = []
-    
-    # Check title and content for harmful patterns
-    text_to_check = f"{title} {content}".lower()
+    # Apply sensitivity adjustments
+    harmful_threshold = 2  # Default for medium
+    if sensitivity == 'low':
+        harmful_threshold = 3
+    elif sensitivity == 'high':
+        harmful_threshold = 1
     
-    # Check each filter category
-    for filter_type in filters:
-        if filter_type in harmful_patterns:
-            patterns = harmful_patterns[filter_type]
-            for pattern in patterns:
-                if pattern in text_to_check:
-                    is_harmful = True
-                    matched_keywords.append(pattern)
+    def verdict_decided(keyword_count, educational_score):
+        # Educational context allows the page whatever else is found (keep going
+        # until a keyword is seen so the category is still reported); without
+        # educational mode, enough keywords make it harmful for good
+        if educational_mode:
+            return educational_score >= 1 and keyword_count >= 1
+        return keyword_count >= harmful_threshold
+    
+    # High sensitivity with educational mode can end up allowing the page and sending
+    # BERT the most keyword-dense windows, which needs every keyword position;
+    # in every other case an early stop cannot change the verdict
+    early_stop = CONTENT_EARLY_STOP and not (sensitivity == 'high' and educational_mode)
+    
+    # Check title and content for harmful patterns and educational context
+    text_to_check = f"{title} {content}"[:CONTENT_MAX_CHARS]
+    with stage_timer("keyword_pass"):
+        matched_keywords, _, educational_score, harmful_positions = scan_text(
+            text_to_check, filters,
+            should_stop=verdict_decided if early_stop else None,
+            block_cache=block_cache if BLOCK_CACHE_SIZE > 0 else None
+        )
+    is_harmful = bool(matched_keywords)
     
     # If harmful and educational mode is on, check for educational context
     if is_harmful and educational_mode:
-        educational_score = 0
-        text_lower = text_to_check.lower()
-        
-        # Check for educational context
-        for term in educational_terms:
-            if term in text_lower:
-                # Give higher score to stronger educational indicators
-                if term in ["research", "study", "paper", "academic", "psychology", 
-                           "education", "prevention", "awareness", "effects", "impact"]:
-                    educational_score += 2
-                else:
-                    educational_score += 1
-        
-        logger.info(f"Educational score for content from URL {url}: {educational_score}")
+        request_logger.info("Educational score for content from URL %s: %s", url, educational_score)
         
         # Lower threshold for educational content detection
         # Single strong educational term is enough
         if educational_score >= 1:
             is_harmful = False
-            logger.info(f"Educational context detected, allowing content")
-    
-    # Apply sensitivity adjustments
-    harmful_threshold = 2  # Default for medium
-    if sensitivity == 'low':
-        harmful_threshold = 3
-    elif sensitivity == 'high':
-        harmful_threshold = 1
+            request_logger.info("Educational context detected, allowing content")
     
     # For medium and low sensitivity, require multiple matches
     if sensitivity != 'high' and len(matched_keywords) < harmful_threshold:
         is_harmful = False
     
+    verdict = {
+        "type": "content",
+        "is_harmful": is_harmful,
+        "keywords": matched_keywords
+    }
+    
     # For high sensitivity with no basic matches, use BERT
     if sensitivity == 'high' and not is_harmful:
-        try:
-            # Use first 1000 chars for BERT analysis
-            sample_text = (title + " " + content[:1000])
-            bert_result = analyze_text_with_bert(sample_text)
-            if bert_result['harmful_probability'] > 0.5:
-                is_harmful = True
-                matched_keywords.extend(bert_result.get('detected_keywords', []))
-        except Exception as e:
-            logger.error(f"BERT analysis error: {str(e)}")
-    
-    return jsonify({
-        "is_harmful": is_harmful,
-        "reason": "Harmful content detected" if is_harmful else "Content allowed",
-        "harmful_keywords": list(set(matched_keywords)),
-        "category": determine_category(matched_keywords)
-    })
+        # Keyword offsets within the content itself (the title and a space come first)
+        offset = len(title) + 1
+        content_positions = [position - offset for position in harmful_positions if position >= offset]
+        verdict["bert_texts"] = [
+            title + " " + window
+            for window in select_content_windows(content[:CONTENT_MAX_CHARS], content_positions)
+        ]
+        verdict["bert_threshold"] = 0.5
+    
+    return verdict
 
-@app.route('/check_domain', methods=['POST'])
-def check_domain():
-    """Check if a domain is known to host harmful content"""
-    # Check if request contains JSON data
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
-    
-    # Safely get data from the request
-    data = request.json or {}
+def select_content_windows(content, keyword_positions):
+    """
+    Pick the fixed-size windows of content that BERT should see
+    Always includes the first window; then the windows with the most keyword
+    hits, then evenly spaced windows, up to CONTENT_MAX_WINDOWS in page order
+    """
+    window_count = max(1, -(-len(content) // CONTENT_WINDOW_CHARS))
+    max_windows = max(1, CONTENT_MAX_WINDOWS)
+    if window_count <= max_windows:
+        selected = set(range(window_count))
+    else:
+        density = {}
+        for position in keyword_positions:
+            window = position // CONTENT_WINDOW_CHARS
+            density[window] = density.get(window, 0) + 1
+        
+        selected = {0}
+        for window in sorted(density, key=lambda window: (-density[window], window)):
+            if len(selected) >= max_windows:
+                break
+            selected.add(window)
+        
+        # Spread the remaining budget over the page
+        step = window_count / max_windows
+        for slot in range(max_windows):
+            if len(selected) >= max_windows:
+                break
+            selected.add(int(slot * step))
+    
+    return [
+        content[window * CONTENT_WINDOW_CHARS:(window + 1) * CONTENT_WINDOW_CHARS]
+        for window in sorted(selected)
+    ]
+
+def evaluate_domain(data):
+    """Check a domain against harmful patterns and known harmful domains"""
     domain = data.get('domain', '')
     sensitivity = data.get('sensitivity', 'medium')
     filters = data.get('filters', ['nsfw', 'violence', 'suicide'])
     
-    logger.info(f"Checking domain: {domain}")
+    request_logger.info("Checking domain: %s", domain)
     
     # Basic pattern matching for domain
-    is_harmful = False
-    matched_patterns = []
-    
-    # Check each filter category
-    for filter_type in filters:
-        if filter_type in harmful_patterns:
-            patterns = harmful_patterns[filter_type]
-            for pattern in patterns:
-                if pattern in domain.lower():
-                    is_harmful = True
-                    matched_patterns.append(pattern)
-    
-    # Known harmful domains list - these would be blocked regardless of sensitivity
-    known_harmful_domains = [
-        "pornhub.com", "xvideos.com", "xnxx.com",
-        "bestgore.com", "liveleak.com", 
-        "suicidemethod.com", "howtokillmyself.com"
-    ]
+    # Domains concatenate words ("freeporn.net"), so match plain substrings here
+    with stage_timer("keyword_pass"):
+        matched_patterns, _, _ = match_patterns(domain, filters, word_boundary=False)
+    is_harmful = bool(matched_patterns)
     
-    for known_domain in known_harmful_domains:
-        if known_domain in domain:
-            is_harmful = True
-            matched_patterns.append(known_domain)
+    # Known harmful domains - these would be blocked regardless of sensitivity
+    known_domain = domain_blocklist.match(domain)
+    if known_domain:
+        is_harmful = True
+        matched_patterns.append(known_domain)
     
     # Apply sensitivity adjustments
     if sensitivity == 'low' and len(matched_patterns) == 1:
         # For low sensitivity, require more evidence unless it's a known domain
-        if domain not in known_harmful_domains:
+        if not known_domain:
             is_harmful = False
     
-    return jsonify({
+    return {
+        "type": "domain",
         "is_harmful": is_harmful,
-        "matched_patterns": matched_patterns,
-        "category": determine_category(matched_patterns)
-    })
+        "keywords": matched_patterns
+    }
+
+# Batch item types and the keyword stage that handles them
+BATCH_EVALUATORS = {
+    "query": evaluate_query,
+    "content": evaluate_content,
+    "domain": evaluate_domain
+}
+
+def analyze_items(items):
+    """
+    Analyze a list of (type, data) items, serving repeats from the verdict cache
+    Returns the formatted results in the same order
+    """
+    results = [None] * len(items)
+    pending = []
+    
+    for index, (item_type, data) in enumerate(items):
+        try:
+            validate_item(item_type, data)
+        except ValueError as e:
+            results[index] = {"error": str(e)}
+            continue
+        key = verdict_cache_key(item_type, data)
+        cached = verdict_cache.get(key)
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending.append((index, key, BATCH_EVALUATORS[item_type](data)))
+    
+    run_bert_checks([verdict for _, _, verdict in pending])
+    
+    for index, key, verdict in pending:
+        result = format_verdict(verdict)
+        if verdict.get("degraded"):
+            verdict_cache.set(key, result, ttl=VERDICT_FALLBACK_TTL)
+        else:
+            verdict_cache.set(key, result)
+        results[index] = result
+    
+    return results
+
+# Text fields each item type reads
+ITEM_TEXT_FIELDS = {
+    "query": ('query',),
+    "content": ('content', 'title', 'url'),
+    "domain": ('domain',)
+}
+
+def validate_item(item_type, data):
+    """
+    Check the fields of one item before it is analyzed
+    Raises ValueError describing the first unusable field
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Item must be an object")
+    for field in ITEM_TEXT_FIELDS[item_type]:
+        if not isinstance(data.get(field, ''), str):
+            raise ValueError(f"'{field}' must be a string")
+    if not isinstance(data.get('sensitivity', 'medium'), str):
+        raise ValueError("'sensitivity' must be a string")
+    filters = data.get('filters', [])
+    if not isinstance(filters, list) or not all(isinstance(f, str) for f in filters):
+        raise ValueError("'filters' must be a list of strings")
+
+def normalize_text(text):
+    """Lowercase and collapse runs of whitespace"""
+    return " ".join(text.split()).lower()
+
+def verdict_cache_key(item_type, data):
+    """
+    Hash the input together with every setting that affects the verdict
+    Text is normalized for the key only (inputs differing in case or spacing
+    share a verdict); the evaluators always see the original text. Page content
+    is only lowercased: collapsing whitespace would cost more than the scan
+    """
+    if item_type == "content":
+        # The URL is only logged, so identical pages on different URLs share a verdict
+        text = [normalize_text(data.get('title', '')), data.get('content', '').lower()]
+    else:
+        text = normalize_text(data.get(item_type, ''))
+    
+    key_fields = [
+        item_type,
+        text,
+        data.get('sensitivity', 'medium'),
+        data.get('educational_mode', True),
+        data.get('filters', ['nsfw', 'violence', 'suicide'])
+    ]
+    serialized = json.dumps(key_fields, sort_keys=True, default=str)
+    return hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+
+def run_bert_checks(verdicts):
+    """
+    Run every pending BERT check in a single model call and apply the results
+    A verdict with several texts (content windows) is harmful if any window is
+    """
+    pending = [verdict for verdict in verdicts if "bert_texts" in verdict]
+    if not pending:
+        return
+    
+    texts = [text for verdict in pending for text in verdict["bert_texts"]]
+    try:
+        with stage_timer("bert"):
+            bert_results, model_failed = score_texts_with_bert(texts)
+            bert_results = iter(bert_results)
+    except Exception as e:
+        logger.error("BERT analysis error: %s", e)
+        for verdict in pending:
+            verdict["degraded"] = True
+        return
+    
+    for verdict in pending:
+        if model_failed:
+            verdict["degraded"] = True
+        for _ in verdict["bert_texts"]:
+            bert_result = next(bert_results)
+            if bert_result['harmful_probability'] > verdict["bert_threshold"]:
+                verdict["is_harmful"] = True
+                verdict["keywords"].extend(bert_result.get('detected_keywords', []))
+
+def format_verdict(verdict):
+    """Build the API response for a finished verdict"""
+    is_harmful = verdict["is_harmful"]
+    keywords = verdict["keywords"]
+    
+    if verdict["type"] == "domain":
+        return {
+            "is_harmful": is_harmful,
+            "matched_patterns": keywords,
+            "category": determine_category(keywords)
+        }
+    
+    result = {
+        "is_harmful": is_harmful,
+        "harmful_keywords": list(set(keywords)),
+        "category": determine_category(keywords)
+    }
+    if verdict["type"] == "content":
+        result["reason"] = "Harmful content detected" if is_harmful else "Content allowed"
+    return result
 
 @app.route('/analyze_image', methods=['POST'])
 def analyze_image():
     """Analyze an image for NSFW/harmful content using YOLO"""
     # Check if request.json exists and has image_url
-    if not request.json or 'image_url' not in request.json:
+    if not isinstance(request.json, dict) or 'image_url' not in request.json:
         return jsonify({"error": "No image URL provided"}), 400
+    if not isinstance(request.json['image_url'], str):
+        return jsonify({"error": "Image URL must be a string"}), 400
     
     # Now safely access data from request.json
     image_url = request.json.get('image_url', '')
@@ -444,7 +826,12 @@ def analyze_image():
     
     try:
         # Use YOLO to detect objects/content in the image
-        result = analyze_image_with_yolo(image_url)
+        if IMAGE_ASYNC_PIPELINE:
+            from image_pipeline import get_image_pipeline
+            result = get_image_pipeline().analyze(image_url)
+        else:
+            from vision_processor import analyze_image_with_yolo
+            result = analyze_image_with_yolo(image_url)
         
         # Determine if image is harmful based on YOLO results
         is_harmful = result['nsfw_probability'] > get_threshold_for_sensitivity(sensitivity)
@@ -455,32 +842,95 @@ def analyze_image():
             "detected_objects": result['detected_objects']
         })
     except Exception as e:
-        logger.error(f"Image analysis error: {str(e)}")
+        logger.error("Image analysis error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-def determine_category(keywords):
-    """Determine the primary category of harmful content"""
-    if not keywords:
-        return "none"
+@app.route('/analyze_images', methods=['POST'])
+def analyze_images():
+    """
+    Analyze many images in one request
+    Each entry is an image URL, {"image_url": ...} or {"image_data": base64};
+    downloads run concurrently and the local model scores them as one batch
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
     
-    category_counts = {
-        "nsfw": 0,
-        "violence": 0,
-        "suicide": 0
-    }
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    images = data.get('images')
+    if not isinstance(images, list):
+        return jsonify({"error": "Request must contain a list of images"}), 400
+    if len(images) > MAX_IMAGE_BATCH:
+        return jsonify({"error": f"Batch is limited to {MAX_IMAGE_BATCH} images"}), 400
     
-    # Count keywords in each category
-    for keyword in keywords:
-        for category, patterns in harmful_patterns.items():
-            if keyword in patterns:
-                category_counts[category] += 1
+    sensitivity = data.get('sensitivity', 'medium')
+    threshold = get_threshold_for_sensitivity(sensitivity)
     
-    # Find category with most matches
-    max_category = max(category_counts.items(), key=lambda x: x[1])
-    if max_category[1] == 0:
-        return "none"
+    results = [None] * len(images)
+    valid_images = []
+    valid_indexes = []
+    for index, entry in enumerate(images):
+        try:
+            valid_images.append(parse_image_entry(entry))
+            valid_indexes.append(index)
+        except ValueError as e:
+            results[index] = {"error": str(e)}
     
-    return max_category[0]
+    try:
+        if IMAGE_ASYNC_PIPELINE:
+            from image_pipeline import get_image_pipeline
+            verdicts = get_image_pipeline().analyze_many(valid_images)
+        else:
+            from vision_processor import analyze_images_with_yolo
+            verdicts = analyze_images_with_yolo(valid_images)
+    except Exception as e:
+        logger.error("Image batch analysis error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    
+    for index, result in zip(valid_indexes, verdicts):
+        if 'error' in result:
+            results[index] = {"error": result['error']}
+        else:
+            results[index] = {
+                "is_harmful": result['nsfw_probability'] > threshold,
+                "nsfw_probability": result['nsfw_probability'],
+                "detected_objects": result['detected_objects']
+            }
+    
+    return jsonify({"results": results})
+
+def parse_image_entry(entry):
+    """
+    Turn one /analyze_images entry into ("url", image_url) or ("bytes", content)
+    Raises ValueError (including ImageRejectedError) for unusable entries
+    """
+    if isinstance(entry, str):
+        entry = {"image_url": entry}
+    if not isinstance(entry, dict):
+        raise ValueError("Image entry must be a URL or an object")
+    
+    if entry.get('image_url'):
+        if not isinstance(entry['image_url'], str):
+            raise ValueError("Image URL must be a string")
+        return ("url", entry['image_url'])
+    
+    image_data = entry.get('image_data')
+    if not image_data or not isinstance(image_data, str):
+        raise ValueError("No image URL or data provided")
+    # Accept data: URIs as produced by canvas.toDataURL()
+    if image_data.startswith('data:'):
+        image_data = image_data.split(',', 1)[-1]
+    try:
+        content = base64.b64decode(image_data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid base64 image data")
+    from vision_processor import load_inline_image
+    return ("bytes", load_inline_image(content))
+
+def determine_category(keywords):
+    """Determine the primary category of harmful content"""
+    return categorize_keywords(keywords)
 
 def get_threshold_for_sensitivity(sensitivity):
     """Get the threshold value based on sensitivity setting"""
@@ -493,6 +943,15 @@ def get_threshold_for_sensitivity(sensitivity):
     else:
         return 0.6  # Default medium
 
+# Startup report (module import to ready app, not counting interpreter start)
+startup_timings["total"] = time.perf_counter() - STARTUP_STARTED
+if __name__ != "__mp_main__":
+    logger.info(
+        "Startup took %.2fs (%s)", startup_timings["total"],
+        ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_timings.items() if phase != "total")
+    )
+
 if __name__ == '__main__':
     # Run the Flask app without SSL (for development)
+    # Production: gunicorn -c gunicorn.conf.py wsgi:app
     app.run(host='0.0.0.0', port=8000, debug=False)
@@ -0,0 +1,215 @@
+"""
+SafeGuard Content Filter - Local Text Classifier Module
+Runs a BERT-style sequence classifier in-process with ONNX Runtime on CPU,
+so high-sensitivity scoring does not depend on an external inference API
+"""
+import os
+import threading
+from dotenv import load_dotenv
+
+from inference_scheduler import MicroBatchScheduler
+
+load_dotenv()
+
+# Which backend scores text: "remote" (Hugging Face Inference API) or "local" (ONNX)
+BERT_BACKEND = os.getenv("BERT_BACKEND", "remote").lower()
+
+# Optional dependencies for local inference, only imported for the local backend
+ONNX_AVAILABLE = False
+if BERT_BACKEND == "local":
+    try:
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        ONNX_AVAILABLE = True
+    except ImportError:
+        pass
+
+# Exported sequence classification model and its tokenizer.json
+BERT_MODEL_PATH = os.getenv("BERT_MODEL_PATH", "")
+BERT_TOKENIZER_PATH = os.getenv(
+    "BERT_TOKENIZER_PATH",
+    os.path.join(os.path.dirname(BERT_MODEL_PATH), "tokenizer.json") if BERT_MODEL_PATH else ""
+)
+
+# Inference settings
+BERT_MAX_SEQ_LENGTH = int(os.getenv("BERT_MAX_SEQ_LENGTH", "128"))
+BERT_NUM_THREADS = int(os.getenv("BERT_NUM_THREADS", "1"))
+
+# Micro-batching of concurrent requests into one forward pass
+BERT_BATCHING = os.getenv("BERT_BATCHING", "true").lower() == "true"
+BERT_BATCH_MAX_SIZE = int(os.getenv("BERT_BATCH_MAX_SIZE", "16"))
+BERT_BATCH_MAX_WAIT_MS = float(os.getenv("BERT_BATCH_MAX_WAIT_MS", "5"))
+# Seconds a request waits for its batched scores before falling back to keywords
+BERT_BATCH_TIMEOUT = float(os.getenv("BERT_BATCH_TIMEOUT", "10"))
+
+# Index of the NEGATIVE label in the model output (0 for SST-2 style models)
+BERT_NEGATIVE_LABEL = int(os.getenv("BERT_NEGATIVE_LABEL", "0"))
+
+
+class LocalTextClassifier:
+    """
+    ONNX Runtime sequence classifier
+    Scores a batch of texts and returns the NEGATIVE label probability for each
+    """
+    def __init__(self, model_path, tokenizer_path, max_seq_length=128,
+                 num_threads=1, negative_label=0):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.negative_label = negative_label
+
+        # Truncate to the model's sequence budget and pad to the longest text in a batch
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+
+    def predict_negative_scores(self, texts):
+        """Run one forward pass over texts and return their NEGATIVE probabilities"""
+        if not texts:
+            return []
+
+        encodings = self.tokenizer.encode_batch(list(texts))
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64)}
+        if "attention_mask" in self.input_names:
+            feeds["attention_mask"] = np.array(
+                [e.attention_mask for e in encodings], dtype=np.int64
+            )
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        logits = self.session.run(None, feeds)[0]
+
+        # Softmax over the label dimension
+        shifted = logits - logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(shifted)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        return probabilities[:, self.negative_label].astype(float).tolist()
+
+
+# Shared classifier, loaded once per process
+_classifier = None
+_classifier_lock = threading.Lock()
+_classifier_failed = False
+_classifier_pid = None
+
+
+def get_local_classifier():
+    """
+    Return the shared local classifier, loading it on first use
+    Returns None when the local backend is not configured or cannot be loaded
+    """
+    global _classifier, _classifier_failed, _classifier_pid
+
+    if _classifier is not None and _classifier_pid != os.getpid() and BERT_NUM_THREADS > 1:
+        # Loaded before a fork: a multi-threaded session's intra-op thread pool does
+        # not exist in this process, so load a fresh copy. A single-threaded session
+        # has no pool and keeps being shared copy-on-write with the parent
+        with _classifier_lock:
+            if _classifier_pid != os.getpid():
+                _classifier = None
+
+    if _classifier is not None or _classifier_failed:
+        return _classifier
+    if BERT_BACKEND != "local":
+        return None
+
+    with _classifier_lock:
+        if _classifier is None and not _classifier_failed:
+            if not ONNX_AVAILABLE:
+                print("Local BERT backend requested but onnxruntime/tokenizers are not installed")
+                _classifier_failed = True
+            elif not BERT_MODEL_PATH:
+                print("Local BERT backend requested but BERT_MODEL_PATH is not set")
+                _classifier_failed = True
+            else:
+                try:
+                    _classifier = LocalTextClassifier(
+                        BERT_MODEL_PATH,
+                        BERT_TOKENIZER_PATH,
+                        max_seq_length=BERT_MAX_SEQ_LENGTH,
+                        num_threads=BERT_NUM_THREADS,
+                        negative_label=BERT_NEGATIVE_LABEL
+                    )
+                    _classifier_pid = os.getpid()
+                except Exception as e:
+                    print(f"Failed to load local BERT model: {str(e)}")
+                    _classifier_failed = True
+
+    return _classifier
+
+
+# Shared micro-batching scheduler in front of the local classifier
+_scheduler = None
+
+
+def _classify_batch(texts):
+    """Scheduler callback; looks the classifier up on each batch so a reload is picked up"""
+    return get_local_classifier().predict_negative_scores(texts)
+
+
+def get_batch_scheduler():
+    """
+    Return the micro-batching scheduler for the local classifier
+    Returns None when batching is disabled or no local classifier is loaded
+    """
+    global _scheduler
+
+    if _scheduler is not None or not BERT_BATCHING:
+        return _scheduler
+
+    classifier = get_local_classifier()
+    if classifier is None:
+        return None
+
+    with _classifier_lock:
+        if _scheduler is None:
+            _scheduler = MicroBatchScheduler(
+                _classify_batch,
+                max_batch_size=BERT_BATCH_MAX_SIZE,
+                max_wait_ms=BERT_BATCH_MAX_WAIT_MS,
+                timeout=BERT_BATCH_TIMEOUT,
+                name="bert"
+            )
+
+    return _scheduler
+
+
+def text_model_stats():
+    """
+    Local model status and scheduler metrics, without loading anything
+    Health checks and metric scrapes use this, so they never trigger a model load
+    """
+    if _classifier is not None:
+        status = "loaded"
+    elif _classifier_failed:
+        status = "failed"
+    else:
+        status = "not loaded"
+    return {
+        "backend": BERT_BACKEND,
+        "model": status,
+        "scheduler": _scheduler.stats() if _scheduler is not None else None
+    }
+
+
+def predict_negative_scores(texts):
+    """
+    Score texts with the local classifier, through the scheduler when enabled
+    Returns None when no local classifier is available
+    """
+    scheduler = get_batch_scheduler()
+    if scheduler is not None:
+        return scheduler.predict(texts)
+
+    classifier = get_local_classifier()
+    if classifier is None:
+        return None
+    return classifier.predict_negative_scores(texts)
@@ -4,12 +4,23 @@ Provides YOLOv5 image analysis to detect NSFW or harmful visual content
 """
 import os
 import io
-import requests
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import json
 import base64
 from urllib.parse import urlparse
 
+import http_client
+from metrics import observe_stage, stage_timer, record_fallback
+from cache import TTLCache, SpillingTTLCache
+from image_workers import (
+    analyze_image_bytes, get_worker_pool, skin_tone_analysis, IMAGE_DECODE_WORKERS
+)
+from object_detector import get_local_detector, YOLO_NSFW_LABELS
+
 # Import error handling utility
 try:
     import cv2
@@ -23,26 +34,184 @@ YOLO_API_ENDPOINT = "https://detect.roboflow.com/nsfw-detection-v1/1"
 
 # If no API key is available, we'll use a fallback method that analyzes image metadata
 
+# Result caches: image URL -> verdict, and content digest -> pixel analysis, so a
+# different URL serving identical bytes reuses the earlier decode
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "10000"))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", "3600"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")  # Optional on-disk spill for digests
+IMAGE_CACHE_DIR_MAX_FILES = int(os.getenv("IMAGE_CACHE_DIR_MAX_FILES", "100000"))
+
+url_cache = TTLCache(maxsize=IMAGE_CACHE_SIZE, ttl=IMAGE_CACHE_TTL)
+content_cache = SpillingTTLCache(
+    maxsize=IMAGE_CACHE_SIZE, ttl=IMAGE_CACHE_TTL, directory=IMAGE_CACHE_DIR or None,
+    max_files=IMAGE_CACHE_DIR_MAX_FILES
+)
+
+# Downloads larger than this many bytes are aborted
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+# Seconds a whole download may take (the read timeout only bounds each socket read)
+IMAGE_FETCH_DEADLINE = float(os.getenv("IMAGE_FETCH_DEADLINE", "15"))
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Decode at 1/N resolution (1, 2, 4 or 8); JPEGs are scaled during decoding
+IMAGE_DECODE_SCALE = int(os.getenv("IMAGE_DECODE_SCALE", "2"))
+
+# Leading bytes of the image formats OpenCV can decode
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp")
+]
+
+
+class ImageRejectedError(ValueError):
+    """Raised when a download is not an image or exceeds the size limit"""
+
+
+def check_image_headers(content_type, content_length, max_bytes=IMAGE_MAX_BYTES):
+    """Reject a response from its headers alone, before any of the body is read"""
+    if 'image' not in (content_type or ''):
+        raise ImageRejectedError("Not an image file")
+    if content_length and str(content_length).isdigit() and int(content_length) > max_bytes:
+        raise ImageRejectedError(f"Image larger than {max_bytes} bytes")
+
+
+def sniff_image_format(head):
+    """Return the image format named by the leading bytes, or None"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def read_capped(chunks, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Collect body chunks, checking the magic bytes once the first bytes arrive
+    and aborting as soon as the total passes max_bytes
+    """
+    buffer = bytearray()
+    sniffed = False
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise ImageRejectedError(f"Image larger than {max_bytes} bytes")
+        if not sniffed and len(buffer) >= 12:
+            if sniff_image_format(bytes(buffer[:12])) is None:
+                raise ImageRejectedError("Not an image file")
+            sniffed = True
+    if not sniffed and sniff_image_format(bytes(buffer)) is None:
+        raise ImageRejectedError("Not an image file")
+    return bytes(buffer)
+
+
+def iter_body(response, expires_at):
+    """
+    Yield a streamed response body as it arrives, raising ImageRejectedError
+    once the monotonic time expires_at has passed
+    urllib3's read1 returns what a single socket read gives, so a host dripping
+    bytes cannot hold the download past the deadline by more than one read timeout
+    """
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is not None:
+        chunks = iter(lambda: read1(IMAGE_CHUNK_SIZE, decode_content=True), b"")
+    else:
+        chunks = response.iter_content(IMAGE_CHUNK_SIZE)
+    for chunk in chunks:
+        if time.monotonic() > expires_at:
+            raise ImageRejectedError("Image download took too long")
+        yield chunk
+
+
+def fetch_image_bytes(image_url, max_bytes=IMAGE_MAX_BYTES, deadline=IMAGE_FETCH_DEADLINE):
+    """
+    Stream an image download with early rejection
+    Returns the image bytes; raises ImageRejectedError for non-images, oversize
+    bodies and downloads still running after deadline seconds
+    """
+    expires_at = time.monotonic() + deadline
+    with stage_timer("image_fetch"):
+        with http_client.get(image_url, stream=True, upstream="image") as response:
+            check_image_headers(
+                response.headers.get('Content-Type', ''),
+                response.headers.get('Content-Length'),
+                max_bytes
+            )
+            return read_capped(iter_body(response, expires_at), max_bytes)
+
+
+def error_verdict(error):
+    """Result for an image that could not be analyzed; never cached"""
+    return {
+        "nsfw_probability": 0.0,
+        "detected_objects": [],
+        "error": str(error)
+    }
+
+
+# NSFW object categories
+NSFW_CATEGORIES = [
+    "nude", "pornography", "nudity", "explicit", "sexual", 
+    "adult", "naked", "nsfw", "explicit content"
+]
+
+# Violence categories
+VIOLENCE_CATEGORIES = [
+    "blood", "gore", "weapon", "gun", "knife", "injury",
+    "dead body", "violence", "wound", "graphic"
+]
+
+
 class YOLODetector:
     """
     YOLO-based detector for harmful content in images
-    Uses external API or falls back to local analysis
+    Uses a local ONNX model when configured (YOLO_BACKEND=local), otherwise the
+    external API, and falls back to filename and skin tone heuristics
+    One instance is shared by all request threads (see get_detector), so it
+    must not hold per-request state
     """
     def __init__(self):
         self.api_key = ROBOFLOW_API_KEY
         self.has_api = bool(self.api_key)
         
-        # NSFW object categories
-        self.nsfw_categories = [
-            "nude", "pornography", "nudity", "explicit", "sexual", 
-            "adult", "naked", "nsfw", "explicit content"
-        ]
-        
-        # Violence categories
-        self.violence_categories = [
-            "blood", "gore", "weapon", "gun", "knife", "injury",
-            "dead body", "violence", "wound", "graphic"
-        ]
+        self.nsfw_categories = NSFW_CATEGORIES + YOLO_NSFW_LABELS
+        self.violence_categories = VIOLENCE_CATEGORIES
+        self.filename_keywords = NSFW_CATEGORIES + VIOLENCE_CATEGORIES
+
+    @property
+    def local_model(self):
+        """The local object detection model, loaded on first use (None if not configured)"""
+        return get_local_detector()
+
+    @property
+    def uses_remote_api(self):
+        """True when images are sent to the detection API instead of being downloaded"""
+        return self.has_api and self.local_model is None
+
+    @property
+    def batches_locally(self):
+        """True when downloaded images are scored together by the local model"""
+        return CV2_AVAILABLE and self.local_model is not None
+
+    def warm_up(self):
+        """
+        Do the one-off work of the local analysis path ahead of the first request:
+        load the local model, or start the image worker processes and load the
+        image codecs for the skin tone heuristic
+        """
+        if self.uses_remote_api or not CV2_AVAILABLE:
+            return
+        if self.local_model is not None:
+            self.local_model.detect([np.zeros((64, 64, 3), np.uint8)])
+            return
+        pool = get_worker_pool()
+        if pool is not None:
+            pool.warm_up()
+        else:
+            skin_tone_analysis(cv2.imencode(".png", np.zeros((8, 8, 3), np.uint8))[1], decode_flag())
 
     def analyze_image(self, image_url):
         """
@@ -57,13 +226,14 @@ class YOLODetector:
                 "error": "Invalid image URL"
             }
         
-        # Try API-based detection if available
-        if self.has_api:
+        # Try API-based detection if available and no local model is configured
+        if self.uses_remote_api:
             try:
                 return self._api_based_detection(image_url)
             except Exception as e:
                 print(f"API-based detection failed: {str(e)}")
                 # Fall back to local analysis on API failure
+                record_fallback("image_detection", "api_error")
                 return self._local_analysis(image_url)
         else:
             # No API key, use local analysis
@@ -79,10 +249,12 @@ class YOLODetector:
         }
         
         # Make request to the YOLO API with the image URL
-        response = requests.post(
-            f"{YOLO_API_ENDPOINT}?api_key={self.api_key}",
-            json={"image": image_url}
-        )
+        with stage_timer("detection_api"):
+            response = http_client.post(
+                f"{YOLO_API_ENDPOINT}?api_key={self.api_key}",
+                json={"image": image_url},
+                upstream="detection_api"
+            )
         
         if response.status_code == 200:
             # Parse the response
@@ -94,20 +266,11 @@ class YOLODetector:
             
             if "predictions" in result:
                 for prediction in result["predictions"]:
-                    object_class = prediction.get("class", "")
-                    confidence = prediction.get("confidence", 0)
-                    
                     detected_objects.append({
-                        "class": object_class,
-                        "confidence": confidence
+                        "class": prediction.get("class", ""),
+                        "confidence": prediction.get("confidence", 0)
                     })
-                    
-                    # Update NSFW confidence if this object is in NSFW categories
-                    if object_class.lower() in self.nsfw_categories:
-                        nsfw_confidence = max(nsfw_confidence, confidence)
-                    elif object_class.lower() in self.violence_categories:
-                        # Violence is also considered harmful
-                        nsfw_confidence = max(nsfw_confidence, confidence * 0.8)  # Slightly lower weight
+                nsfw_confidence = self._nsfw_confidence(detected_objects)
             
             return {
                 "nsfw_probability": nsfw_confidence,
@@ -121,66 +284,46 @@ class YOLODetector:
                 "error": f"API request failed with status code {response.status_code}"
             }
 
+    def _nsfw_confidence(self, detected_objects):
+        """Highest confidence among detected NSFW or violent objects"""
+        nsfw_confidence = 0.0
+        for detected in detected_objects:
+            object_class = detected["class"].lower()
+            confidence = detected["confidence"]
+            
+            # Update NSFW confidence if this object is in NSFW categories
+            if object_class in self.nsfw_categories:
+                nsfw_confidence = max(nsfw_confidence, confidence)
+            elif object_class in self.violence_categories:
+                # Violence is also considered harmful
+                nsfw_confidence = max(nsfw_confidence, confidence * 0.8)  # Slightly lower weight
+        return nsfw_confidence
+
     def _local_analysis(self, image_url):
         """
         Fallback method when API is not available
         Uses image metadata and basic image analysis
         """
         try:
-            # Download image headers only first to check metadata
-            head_response = requests.head(image_url, allow_redirects=True)
-            content_type = head_response.headers.get('Content-Type', '')
-            
-            # If not an image, return zero probability
-            if 'image' not in content_type:
-                return {
-                    "nsfw_probability": 0.0,
-                    "detected_objects": [],
-                    "error": "Not an image file"
-                }
-            
-            # Extract filename from URL to check for suspicious names
-            url_path = urlparse(image_url).path
-            filename = os.path.basename(url_path).lower()
-            
-            # Check filename for NSFW indicators
-            nsfw_probability = 0.0
-            detected_keywords = []
-            
-            # Check filename against NSFW keywords
-            for keyword in self.nsfw_categories + self.violence_categories:
-                if keyword in filename:
-                    nsfw_probability = max(nsfw_probability, 0.7)  # Filename match gives high probability
-                    detected_keywords.append(keyword)
-            
-            # If we have OpenCV available, try to analyze the image
             if CV2_AVAILABLE:
-                # Download the image
-                img_response = requests.get(image_url)
-                img_array = np.frombuffer(img_response.content, np.uint8)
-                img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+                # Stream the image for pixel analysis; headers and magic bytes are
+                # checked before the body is read and the download is size-capped
+                content = fetch_image_bytes(image_url)
+            else:
+                # Download image headers only to check metadata
+                head_response = http_client.head(image_url, allow_redirects=True, upstream="image")
+                content_type = head_response.headers.get('Content-Type', '')
                 
-                if img is not None:
-                    # Calculate color distribution - NSFW content often has specific skin tone distributions
-                    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-                    
-                    # Skin tone detection (simplified approach)
-                    lower_skin = np.array([0, 20, 70], dtype=np.uint8)
-                    upper_skin = np.array([20, 150, 255], dtype=np.uint8)
-                    skin_mask = cv2.inRange(hsv, lower_skin, upper_skin)
-                    
-                    # Calculate percentage of skin tone pixels
-                    skin_percentage = np.count_nonzero(skin_mask) / (img.shape[0] * img.shape[1])
-                    
-                    # High skin percentage might indicate NSFW content
-                    if skin_percentage > 0.5:
-                        nsfw_probability = max(nsfw_probability, skin_percentage * 0.6)
-                        detected_keywords.append("high skin tone percentage")
+                # If not an image, return zero probability
+                if 'image' not in content_type:
+                    return {
+                        "nsfw_probability": 0.0,
+                        "detected_objects": [],
+                        "error": "Not an image file"
+                    }
+                content = None
             
-            return {
-                "nsfw_probability": nsfw_probability,
-                "detected_objects": detected_keywords
-            }
+            return self.analyze_downloaded_image(image_url, content)
                 
         except Exception as e:
             print(f"Local image analysis error: {str(e)}")
@@ -190,6 +333,158 @@ class YOLODetector:
                 "error": str(e)
             }
 
+    def analyze_downloaded_image(self, image_url, content=None):
+        """
+        Analyze an image whose bytes have already been fetched
+        Uses the local model when one is configured; otherwise combines filename
+        checks with pixel analysis of content (when given)
+        """
+        if CV2_AVAILABLE and content is not None and self.local_model is not None:
+            detected_objects = self._cached_detection(content)
+            if detected_objects is not None:
+                return {
+                    "nsfw_probability": self._nsfw_confidence(detected_objects),
+                    "detected_objects": detected_objects
+                }
+        
+        # Extract filename from URL to check for suspicious names
+        url_path = urlparse(image_url).path
+        filename = os.path.basename(url_path).lower()
+        
+        # Check filename for NSFW indicators
+        nsfw_probability = 0.0
+        detected_keywords = []
+        
+        # Check filename against NSFW keywords
+        for keyword in self.filename_keywords:
+            if keyword in filename:
+                nsfw_probability = max(nsfw_probability, 0.7)  # Filename match gives high probability
+                detected_keywords.append(keyword)
+        
+        # If we have OpenCV available, try to analyze the image
+        if CV2_AVAILABLE and content is not None:
+            pixel_analysis = self._cached_pixel_analysis(content)
+            
+            skin_percentage = pixel_analysis.get("skin_percentage")
+            
+            # High skin percentage might indicate NSFW content
+            if skin_percentage is not None and skin_percentage > 0.5:
+                nsfw_probability = max(nsfw_probability, skin_percentage * 0.6)
+                detected_keywords.append("high skin tone percentage")
+        
+        return {
+            "nsfw_probability": nsfw_probability,
+            "detected_objects": detected_keywords
+        }
+
+    def _cached_pixel_analysis(self, content):
+        """
+        Pixel analysis of downloaded image bytes, cached by content digest
+        The filename checks depend on the URL, so only this part is shared
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        cached = content_cache.get(digest)
+        if cached is not None:
+            return cached
+        
+        pixel_analysis = self._analyze_pixels(content)
+        content_cache.set(digest, pixel_analysis)
+        return pixel_analysis
+
+    def analyze_downloaded_image_safely(self, image_url, content=None):
+        """
+        analyze_downloaded_image returning an error verdict instead of raising
+        (worker pool timeouts, a broken pool, decode failures)
+        """
+        try:
+            return self.analyze_downloaded_image(image_url, content)
+        except Exception as e:
+            print(f"Image analysis error: {str(e)}")
+            return error_verdict(e)
+
+    def analyze_downloaded_images(self, images):
+        """
+        Analyze several downloaded images given as (image_url, content) pairs
+        With a local model, every image not already cached goes through one
+        batched detection call; returns one result per image
+        """
+        if not self.batches_locally:
+            # One task per image, so a batch keeps several worker processes busy
+            executor = get_batch_executor()
+            futures = [
+                executor.submit(self.analyze_downloaded_image_safely, image_url, content)
+                for image_url, content in images
+            ]
+            return [future.result() for future in futures]
+        
+        try:
+            detections = self._cached_detections([content for _, content in images])
+        except Exception as e:
+            print(f"Image analysis error: {str(e)}")
+            return [error_verdict(e) for _ in images]
+        results = []
+        for (image_url, content), detected_objects in zip(images, detections):
+            if detected_objects is None:
+                # Undecodable image: fall back to the filename check
+                record_fallback("image_detection", "undecodable")
+                results.append(self.analyze_downloaded_image_safely(image_url))
+            else:
+                results.append({
+                    "nsfw_probability": self._nsfw_confidence(detected_objects),
+                    "detected_objects": detected_objects
+                })
+        return results
+
+    def _cached_detection(self, content):
+        """
+        Local model detections for downloaded image bytes, cached by content digest
+        Returns None if the image could not be decoded
+        """
+        return self._cached_detections([content])[0]
+
+    def _cached_detections(self, contents):
+        """Batched _cached_detection: decodes and runs the model only on cache misses"""
+        keys = [hashlib.sha256(content).hexdigest() + "-objects" for content in contents]
+        detections = [None] * len(contents)
+        
+        missing = []
+        for index, key in enumerate(keys):
+            cached = content_cache.get(key)
+            if cached is not None:
+                detections[index] = cached["detected_objects"]
+            else:
+                missing.append(index)
+        
+        # Decode one model batch at a time so at most that many decoded images are held
+        batch_size = self.local_model.batch_size
+        for start in range(0, len(missing), batch_size):
+            decoded = []
+            for index in missing[start:start + batch_size]:
+                with stage_timer("decode"):
+                    img = cv2.imdecode(np.frombuffer(contents[index], np.uint8), cv2.IMREAD_COLOR)
+                if img is not None:
+                    decoded.append((index, img))
+            if not decoded:
+                continue
+            with stage_timer("inference"):
+                found = self.local_model.detect([img for _, img in decoded])
+            for (index, _), detected_objects in zip(decoded, found):
+                detections[index] = detected_objects
+                content_cache.set(keys[index], {"detected_objects": detected_objects})
+        return detections
+
+    def _analyze_pixels(self, content):
+        """
+        Decode image bytes and measure the share of skin tone pixels
+        Runs in the image worker pool when enabled (see image_workers.py)
+        Returns a dictionary with skin_percentage (None if the image could not be decoded)
+        """
+        result = analyze_image_bytes(content, decode_flag())
+        # Stage timings are measured where the work ran (possibly a worker process)
+        observe_stage("decode", result["timings"]["decode"] / 1000)
+        observe_stage("pixel_analysis", result["timings"]["analysis"] / 1000)
+        return {"skin_percentage": result["skin_percentage"]}
+
     def _is_valid_image_url(self, url):
         """
         Check if a URL points to a valid image
@@ -209,7 +504,7 @@ class YOLODetector:
                 
             # If no extension, try to get headers
             try:
-                response = requests.head(url, timeout=3)
+                response = http_client.head(url, timeout=3, upstream="image")
                 content_type = response.headers.get('Content-Type', '')
                 return 'image/' in content_type
             except:
@@ -219,13 +514,134 @@ class YOLODetector:
             return False
 
 
+def decode_flag():
+    """cv2.imdecode flag for the configured IMAGE_DECODE_SCALE"""
+    return {
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8
+    }.get(IMAGE_DECODE_SCALE, cv2.IMREAD_COLOR)
+
+
+# Threads handing the images of a batch to the worker pool concurrently
+# (created per process on first use; threads do not survive a fork)
+_batch_executor = None
+_batch_executor_pid = None
+_batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor():
+    """Return the thread pool that runs per-image analyses of a batch"""
+    global _batch_executor, _batch_executor_pid
+
+    pid = os.getpid()
+    if _batch_executor is None or _batch_executor_pid != pid:
+        with _batch_executor_lock:
+            if _batch_executor is None or _batch_executor_pid != pid:
+                _batch_executor = ThreadPoolExecutor(
+                    max(1, IMAGE_DECODE_WORKERS), thread_name_prefix="image-batch"
+                )
+                _batch_executor_pid = pid
+    return _batch_executor
+
+
+# One detector per process, shared by all request threads
+_detector = None
+_detector_pid = None
+_detector_lock = threading.Lock()
+
+
+def get_detector():
+    """Return the detector for this process, creating it on first use"""
+    global _detector, _detector_pid
+
+    pid = os.getpid()
+    if _detector is None or _detector_pid != pid:
+        with _detector_lock:
+            if _detector is None or _detector_pid != pid:
+                _detector = YOLODetector()
+                _detector_pid = pid
+    return _detector
+
+
+def warm_up_image_analysis():
+    """Create the shared detector and warm it up; returns the time taken in seconds"""
+    started = time.perf_counter()
+    try:
+        get_detector().warm_up()
+    except Exception as e:
+        print(f"Image analysis warm-up failed: {str(e)}")
+    return time.perf_counter() - started
+
+
 def analyze_image_with_yolo(image_url):
     """
     Analyze an image for NSFW/harmful content using YOLO
     Returns analysis results with NSFW probability and detected objects
     """
-    detector = YOLODetector()
-    return detector.analyze_image(image_url)
+    cached = url_cache.get(image_url)
+    if cached is not None:
+        return cached
+    
+    result = get_detector().analyze_image(image_url)
+    
+    # Errors are usually transient (network, upstream API), so only cache verdicts
+    if 'error' not in result:
+        url_cache.set(image_url, result)
+    return result
+
+
+def load_inline_image(content):
+    """Validate inline image bytes with the same magic byte and size checks as downloads"""
+    return read_capped([content], IMAGE_MAX_BYTES)
+
+
+def analyze_images_with_yolo(images):
+    """
+    Analyze a batch of images given as ("url", image_url) or ("bytes", content)
+    Downloads run one after another here; the async pipeline fetches concurrently.
+    Returns one result per image, in order
+    """
+    detector = get_detector()
+    results = [None] * len(images)
+    downloaded = []
+    
+    for index, (kind, value) in enumerate(images):
+        if kind == "url":
+            cached = url_cache.get(value)
+            if cached is not None:
+                results[index] = cached
+            elif detector.uses_remote_api or not CV2_AVAILABLE:
+                results[index] = analyze_image_with_yolo(value)
+            else:
+                try:
+                    downloaded.append((index, value, fetch_image_bytes(value)))
+                except Exception as e:
+                    print(f"Image fetch error: {str(e)}")
+                    results[index] = {
+                        "nsfw_probability": 0.0,
+                        "detected_objects": [],
+                        "error": str(e)
+                    }
+        else:
+            downloaded.append((index, "", value))
+    
+    verdicts = detector.analyze_downloaded_images(
+        [(image_url, content) for _, image_url, content in downloaded]
+    )
+    for (index, image_url, _), verdict in zip(downloaded, verdicts):
+        if image_url and 'error' not in verdict:
+            url_cache.set(image_url, verdict)
+        results[index] = verdict
+    return results
+
+
+def image_cache_stats():
+    """Return hit/miss counters for the URL and content digest caches"""
+    return {
+        "url": url_cache.stats(),
+        "content": content_cache.stats()
+    }
 
 
 # For testing
@@ -0,0 +1,46 @@
+"""
+SafeGuard Content Filter - Production WSGI Entry Point
+Run with: gunicorn -c gunicorn.conf.py wsgi:app
+
+The master process imports this module once (preload_app) and then forks the
+workers, so the pattern matcher, the domain blocklist and single-threaded ONNX
+sessions are built once and shared copy-on-write. Anything that owns threads or
+child processes is started per worker in init_worker()
+"""
+import os
+
+# Preforked servers load models and the image stack once in the master by default,
+# so workers share them; WARMUP=false keeps everything lazy (text-only nodes)
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+IMAGE_WARMUP = os.getenv("IMAGE_WARMUP", str(WARMUP)).lower() == "true"
+
+# The image worker pool (and its fork server) must belong to the worker that uses
+# it, so the image warm-up is deferred from import time to init_worker()
+os.environ["WARMUP"] = str(WARMUP).lower()
+os.environ["IMAGE_WARMUP"] = "false"
+
+from server import app, logger
+from text_classifier import get_local_classifier
+import metrics
+
+
+def init_worker():
+    """
+    Per-worker startup, called by gunicorn after each fork
+    Models already loaded by the master are reused unless they need their own
+    thread pools; the image worker processes start here
+    """
+    metrics.start_snapshot_writer()
+    if WARMUP:
+        get_local_classifier()
+    if IMAGE_WARMUP:
+        from vision_processor import warm_up_image_analysis
+        logger.info("Image analysis warmed up in %.2fs (pid %s)", warm_up_image_analysis(), os.getpid())
+
+
+# Import the image stack and build the image model in the master before forking
+# (server.py loads the text model when WARMUP is set)
+if IMAGE_WARMUP:
+    import image_pipeline
+    from object_detector import get_local_detector
+    get_local_detector()